@@ -2,49 +2,105 @@ import os
 import sys
 import json
 import time
+import asyncio
+import atexit
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 import logging
+import logging.handlers
 
+import dotenv
+import orjson
 import pandas as pd
 import numpy as np
+import yfinance as yf
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import uvicorn
 
+# Try importing uvloop/httptools for a faster event loop and HTTP parser
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
+try:
+    import httptools
+    HTTPTOOLS_AVAILABLE = True
+except ImportError:
+    HTTPTOOLS_AVAILABLE = False
+
+# Directory principale del progetto (calcolata una sola volta all'import)
+BASE_DIR = Path(__file__).resolve().parent.parent
+DOTENV_FILE = BASE_DIR / ".env"
+
+# Carica le variabili d'ambiente una sola volta all'avvio
+dotenv.load_dotenv(DOTENV_FILE)
+
 # Aggiungi il percorso corrente al sys.path per importare i moduli locali
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(str(BASE_DIR))
 
 # Importa i moduli locali
 from python import signal_engine
 from python import api_usage_tracker
 from python import deepseek_utils
+from python import indicators_numba
+
+# Compila i kernel Numba all'avvio, così la prima richiesta non paga la latenza di compilazione,
+# e usa il kernel Donchian solo se coincide con il ripiego pandas (NaN compresi)
+DONCHIAN_NUMBA = False
+if indicators_numba.NUMBA_AVAILABLE:
+    indicators_numba.warmup()
+    DONCHIAN_NUMBA = indicators_numba.donchian_matches_pandas()
+
+# Configura il logger: i record passano da una coda e vengono scritti da un thread dedicato,
+# così le scritture su file non bloccano l'event loop
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_file_handler = logging.FileHandler("logs/api_server.log")
+log_file_handler.setFormatter(log_formatter)
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(log_formatter)
 
-# Configura il logger
+log_queue = queue.Queue(-1)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/api_server.log"),
-        logging.StreamHandler()
-    ]
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
+log_listener = logging.handlers.QueueListener(log_queue, log_file_handler, log_stream_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 logger = logging.getLogger("api_server")
 
 # Crea l'applicazione FastAPI
 app = FastAPI(
     title="OpenMT4TradingBot API",
     description="API per il controllo e il monitoraggio di OpenMT4TradingBot",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
-# Abilita CORS per permettere richieste dall'interfaccia React
+# Abilita CORS per permettere richieste dall'interfaccia React.
+# Le origini sono configurabili tramite CORS_ORIGINS (lista separata da virgole):
+# con allow_credentials i browser ignorano comunque "*".
+CORS_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("CORS_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000").split(",")
+    if origin.strip()
+]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # In produzione, limitare agli origine specifici
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -59,7 +115,50 @@ except Exception as e:
     logger.error(f"Errore nell'inizializzazione di SignalEngine: {e}")
 
 # Path per i file di dati
-SIGNAL_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "signal.json")
+SIGNAL_FILE = BASE_DIR / "signal.json"
+
+# Mapping dei timeframe della dashboard sugli intervalli Yahoo Finance
+TIMEFRAME_MAP = {
+    "1h": "1h",
+    "4h": "4h",
+    "1d": "1d",
+    "1w": "1wk"
+}
+
+# Conversione dei simboli MT4 nei ticker Yahoo Finance
+SYMBOL_MAP = {
+    "XAUUSD": "GC=F",     # Gold Futures
+    "XAGUSD": "SI=F",     # Silver Futures
+    "WTICOUSD": "CL=F",   # WTI Crude Oil
+    "BCOUSD": "BZ=F",     # Brent Crude Oil
+    "NATGASUSD": "NG=F",  # Natural Gas
+    "CORNUSD": "ZC=F",    # Corn Futures
+    "SOYBNUSD": "ZS=F",   # Soybean Futures
+    "WHEATUSD": "ZW=F"    # Wheat Futures
+}
+
+# Cache del file dei segnali, invalidata dal cambio di mtime
+_signal_cache = {"mtime": 0, "raw": b"{}", "data": {}}
+
+# Cache LRU in memoria dei dati dei grafici, indicizzata per (ticker Yahoo, intervallo):
+# limitata perché il simbolo arriva dal client e ogni voce contiene 3 mesi di dati
+CHART_CACHE = OrderedDict()
+CHART_CACHE_MAXSIZE = 128
+_chart_cache_lock = threading.Lock()
+
+# Durata della cache dei grafici per intervallo (in secondi)
+CHART_CACHE_TTL = {
+    "default": 60,   # 1 minuto per i timeframe intraday
+    "1d": 3600,      # 1 ora per i dati giornalieri
+    "1wk": 3600,     # 1 ora per i dati settimanali
+}
+
+# Cache di breve durata per le letture del tracker di utilizzo API (dati vecchi di 1 secondo vanno bene per la UI)
+TRACKER_CACHE = {}
+TRACKER_CACHE_TTL = 1.0
+
+# Pool di thread per le chiamate bloccanti (download yfinance) fuori dall'event loop
+THREAD_POOL = ThreadPoolExecutor(max_workers=8)
 
 # Modelli di dati
 class BotControlRequest(BaseModel):
@@ -82,7 +181,7 @@ bot_state = {
     "engine_status": "stopped",
     "chat_status": "stopped",
     "deepseek_enabled": True,
-    "daily_limit": 5.0,
+    "daily_limit": float(os.getenv("DEEPSEEK_DAILY_LIMIT", "5.0")),  # Aggiornato solo da update_config
     "throttling_config": {
         "normal_threshold": 0.2,
         "light_threshold": 0.4,
@@ -93,94 +192,158 @@ bot_state = {
     "last_update": datetime.now().isoformat()
 }
 
+# Lock per le scritture su bot_state (motore in background e richieste concorrenti)
+_STATE_LOCK = threading.RLock()
+
 # Funzioni di utilità
+def _snapshot_bot_state() -> Dict:
+    """Restituisce una copia coerente di bot_state da serializzare fuori dal lock."""
+    with _STATE_LOCK:
+        snapshot = dict(bot_state)
+        snapshot["throttling_config"] = dict(bot_state["throttling_config"])
+    return snapshot
+
+def _cached_tracker_call(name: str, func):
+    """Restituisce il risultato di una funzione del tracker, ricalcolandolo al massimo una volta ogni TTL."""
+    cache_entry = TRACKER_CACHE.get(name)
+    if cache_entry and time.time() - cache_entry["timestamp"] <= TRACKER_CACHE_TTL:
+        return cache_entry["data"]
+    
+    data = func()
+    TRACKER_CACHE[name] = {
+        "timestamp": time.time(),
+        "data": data
+    }
+    return data
+
+def _refresh_signal_cache() -> None:
+    """Ricarica il file dei segnali nella cache solo se il suo mtime è cambiato."""
+    try:
+        mtime = os.stat(SIGNAL_FILE).st_mtime_ns
+    except FileNotFoundError:
+        _signal_cache.update(mtime=0, raw=b"{}", data={})
+        return
+
+    if mtime == _signal_cache["mtime"]:
+        return
+
+    with open(SIGNAL_FILE, "rb") as f:
+        raw = f.read()
+
+    _signal_cache.update(mtime=mtime, raw=raw, data=orjson.loads(raw))
+
 def read_signal_file() -> Dict:
-    """Legge il file dei segnali."""
+    """Legge il file dei segnali, riutilizzando il contenuto se il file non è cambiato."""
     try:
-        if os.path.exists(SIGNAL_FILE):
-            with open(SIGNAL_FILE, "r") as f:
-                return json.load(f)
-        return {}
+        _refresh_signal_cache()
+        return _signal_cache["data"]
     except Exception as e:
         logger.error(f"Errore nella lettura del file dei segnali: {e}")
         return {}
 
-def get_ohlc_data(symbol: str, timeframe: str = "1d") -> Dict:
-    """Ottiene i dati OHLC per un simbolo."""
+def read_signal_bytes() -> bytes:
+    """Restituisce il contenuto JSON grezzo del file dei segnali."""
     try:
-        # Utilizzare yfinance per ottenere dati storici
-        import yfinance as yf
-        
-        # Mapping dei timeframe
-        tf_mapping = {
-            "1h": "1h",
-            "4h": "4h",
-            "1d": "1d",
-            "1w": "1wk"
+        _refresh_signal_cache()
+        return _signal_cache["raw"]
+    except Exception as e:
+        logger.error(f"Errore nella lettura del file dei segnali: {e}")
+        return b"{}"
+
+def _build_chart_payload(yahoo_symbol: str, interval: str) -> Dict:
+    """Scarica i dati da Yahoo Finance e prepara date, OHLC e Donchian."""
+    # Controlla prima la cache in memoria (le voci scadute vengono rimosse)
+    cache_key = (yahoo_symbol, interval)
+    ttl = CHART_CACHE_TTL.get(interval, CHART_CACHE_TTL["default"])
+    with _chart_cache_lock:
+        cache_entry = CHART_CACHE.get(cache_key)
+        if cache_entry:
+            if time.time() - cache_entry["timestamp"] <= ttl:
+                CHART_CACHE.move_to_end(cache_key)
+                return cache_entry["data"]
+            del CHART_CACHE[cache_key]
+
+    # Scarica i dati da Yahoo Finance
+    data = yf.download(
+        yahoo_symbol, 
+        period="3mo", 
+        interval=interval,
+        progress=False
+    )
+    
+    # Prepara i dati
+    if data.empty:
+        return {
+            "dates": [],
+            "ohlc": {}
         }
         
-        # Converti il simbolo MT4 in un ticker Yahoo Finance
-        yahoo_symbol = symbol
-        if symbol == "XAUUSD":
-            yahoo_symbol = "GC=F"  # Gold Futures
-        elif symbol == "XAGUSD":
-            yahoo_symbol = "SI=F"  # Silver Futures
-        elif symbol == "WTICOUSD":
-            yahoo_symbol = "CL=F"  # WTI Crude Oil
-        elif symbol == "BCOUSD":
-            yahoo_symbol = "BZ=F"  # Brent Crude Oil
-        elif symbol == "NATGASUSD":
-            yahoo_symbol = "NG=F"  # Natural Gas
-        elif symbol == "CORNUSD":
-            yahoo_symbol = "ZC=F"  # Corn Futures
-        elif symbol == "SOYBNUSD":
-            yahoo_symbol = "ZS=F"  # Soybean Futures
-        elif symbol == "WHEATUSD":
-            yahoo_symbol = "ZW=F"  # Wheat Futures
-        
-        # Scarica i dati
-        data = yf.download(
-            yahoo_symbol, 
-            period="3mo", 
-            interval=tf_mapping.get(timeframe, "1d"),
-            progress=False
-        )
-        
-        # Prepara i dati
-        if data.empty:
-            return {
-                "dates": [],
-                "ohlc": []
-            }
-            
-        # Converti i dati in formato per il grafico
-        dates = data.index.strftime('%Y-%m-%d %H:%M:%S').tolist()
-        ohlc = []
+    # Converti i dati in formato per il grafico
+    # Date come millisecondi epoch (UTC), interpretati nativamente dai grafici
+    dates = data.index.as_unit('ms').asi8
+
+    # OHLC in formato colonnare (un array per campo) invece di un dict per barra
+    ohlc = {
+        "open": data['Open'].to_numpy(dtype=np.float64),
+        "high": data['High'].to_numpy(dtype=np.float64),
+        "low": data['Low'].to_numpy(dtype=np.float64),
+        "close": data['Close'].to_numpy(dtype=np.float64),
+        "volume": data['Volume'].to_numpy(dtype=np.float64) if 'Volume' in data.columns else np.zeros(len(data))
+    }
+    
+    # Calcola l'indicatore Donchian riutilizzando gli array già estratti per il payload
+    if len(data) > 20:
+        period = 20
+        if DONCHIAN_NUMBA:
+            high_max, low_min = indicators_numba.donchian(ohlc["high"], ohlc["low"], period)
+        else:
+            high_max = pd.Series(ohlc["high"]).rolling(window=period).max()
+            low_min = pd.Series(ohlc["low"]).rolling(window=period).min()
         
-        for i in range(len(data)):
-            ohlc.append({
-                "open": data['Open'].iloc[i],
-                "high": data['High'].iloc[i],
-                "low": data['Low'].iloc[i],
-                "close": data['Close'].iloc[i],
-                "volume": data['Volume'].iloc[i] if 'Volume' in data.columns else 0
-            })
+        # Array NumPy serializzati direttamente da orjson (NaN -> null)
+        donchian = {
+            "upper": np.asarray(high_max, dtype=np.float64),
+            "lower": np.asarray(low_min, dtype=np.float64)
+        }
+    else:
+        donchian = {
+            "upper": [],
+            "lower": []
+        }
+
+    payload = {
+        "dates": dates,
+        "ohlc": ohlc,
+        "donchian": donchian
+    }
+
+    # Salva il payload già pronto, così le richieste successive saltano download e conversione
+    now = time.time()
+    with _chart_cache_lock:
+        # Elimina le voci scadute, poi le meno usate di recente oltre il limite
+        expired = [
+            key for key, entry in CHART_CACHE.items()
+            if now - entry["timestamp"] > CHART_CACHE_TTL.get(key[1], CHART_CACHE_TTL["default"])
+        ]
+        for key in expired:
+            del CHART_CACHE[key]
+        CHART_CACHE[cache_key] = {
+            "timestamp": now,
+            "data": payload
+        }
+        CHART_CACHE.move_to_end(cache_key)
+        while len(CHART_CACHE) > CHART_CACHE_MAXSIZE:
+            CHART_CACHE.popitem(last=False)
+    return payload
+
+def get_ohlc_data(symbol: str, timeframe: str = "1d") -> Dict:
+    """Ottiene i dati OHLC per un simbolo."""
+    try:
+        yahoo_symbol = SYMBOL_MAP.get(symbol, symbol)
         
-        # Calcola l'indicatore Donchian
-        if len(data) > 20:
-            period = 20
-            high_max = data['High'].rolling(window=period).max()
-            low_min = data['Low'].rolling(window=period).min()
-            
-            donchian = {
-                "upper": high_max.tolist(),
-                "lower": low_min.tolist()
-            }
-        else:
-            donchian = {
-                "upper": [],
-                "lower": []
-            }
+        chart_payload = _build_chart_payload(yahoo_symbol, TIMEFRAME_MAP.get(timeframe, "1d"))
+        if len(chart_payload["dates"]) == 0:
+            return chart_payload
         
         # Leggi i segnali dal file
         signals_data = read_signal_file()
@@ -191,7 +354,17 @@ def get_ohlc_data(symbol: str, timeframe: str = "1d") -> Dict:
             if signal_info.get("signal") != "neutral":
                 # Trova il prezzo più vicino nel set di dati
                 signal_price = signal_info.get("entry", 0)
-                signal_date = datetime.now().strftime('%Y-%m-%d')
+                close = chart_payload["ohlc"]["close"]
+                if indicators_numba.NUMBA_AVAILABLE:
+                    signal_idx = indicators_numba.nearest_index(close, float(signal_price))
+                else:
+                    # Senza Numba il kernel sarebbe un ciclo Python: meglio la versione vettoriale
+                    distance = np.abs(close - float(signal_price))
+                    signal_idx = -1 if np.isnan(distance).all() else int(np.nanargmin(distance))
+                if signal_idx >= 0:
+                    signal_date = int(chart_payload["dates"][signal_idx])
+                else:
+                    signal_date = int(time.time() * 1000)
                 
                 # Aggiungi il segnale
                 signals.append({
@@ -201,23 +374,21 @@ def get_ohlc_data(symbol: str, timeframe: str = "1d") -> Dict:
                 })
         
         return {
-            "dates": dates,
-            "ohlc": ohlc,
-            "donchian": donchian,
+            **chart_payload,
             "signals": signals
         }
     except Exception as e:
         logger.error(f"Errore nell'ottenimento dei dati OHLC per {symbol}: {e}")
         return {
             "dates": [],
-            "ohlc": []
+            "ohlc": {}
         }
 
 def start_signal_engine(background_tasks: BackgroundTasks):
     """Avvia il motore dei segnali in background."""
     def run_signal_engine():
-        global bot_state
-        bot_state["engine_status"] = "running"
+        with _STATE_LOCK:
+            bot_state["engine_status"] = "running"
         
         try:
             if signal_engine_instance:
@@ -227,7 +398,8 @@ def start_signal_engine(background_tasks: BackgroundTasks):
         except Exception as e:
             logger.error(f"Errore durante l'esecuzione del motore dei segnali: {e}")
         finally:
-            bot_state["engine_status"] = "stopped"
+            with _STATE_LOCK:
+                bot_state["engine_status"] = "stopped"
     
     background_tasks.add_task(run_signal_engine)
     return {"status": "started"}
@@ -241,7 +413,7 @@ async def root():
 async def get_active_markets():
     """Ottiene la lista dei mercati attivi."""
     try:
-        active_markets = api_usage_tracker.get_active_markets()
+        active_markets = _cached_tracker_call("active_markets", api_usage_tracker.get_active_markets)
         return {"markets": active_markets}
     except Exception as e:
         logger.error(f"Errore nell'ottenimento dei mercati attivi: {e}")
@@ -250,15 +422,16 @@ async def get_active_markets():
 @app.get("/api/signals")
 async def get_signals():
     """Ottiene i segnali di trading correnti."""
-    return read_signal_file()
+    # Il file è già JSON: lo restituiamo così com'è senza riparsarlo e riserializzarlo
+    return Response(read_signal_bytes(), media_type="application/json")
 
 @app.get("/api/usage")
 async def get_api_usage():
     """Ottiene le informazioni sull'utilizzo dell'API DeepSeek."""
     try:
-        usage_report = api_usage_tracker.get_usage_report()
-        throttling_level = api_usage_tracker.get_throttling_level()
-        active_markets = api_usage_tracker.get_active_markets()
+        usage_report = _cached_tracker_call("usage_report", api_usage_tracker.get_usage_report)
+        throttling_level = _cached_tracker_call("throttling_level", api_usage_tracker.get_throttling_level)
+        active_markets = _cached_tracker_call("active_markets", api_usage_tracker.get_active_markets)
         
         return {
             "daily": usage_report.get("daily", {}),
@@ -280,26 +453,35 @@ async def get_api_usage():
 @app.get("/api/chart-data")
 async def get_chart_data(symbol: str, timeframe: str = "1d"):
     """Ottiene i dati per il grafico di un simbolo."""
-    return get_ohlc_data(symbol, timeframe)
+    loop = asyncio.get_running_loop()
+    chart_data = await loop.run_in_executor(THREAD_POOL, get_ohlc_data, symbol, timeframe)
+    # Risposta diretta: il payload contiene array NumPy che orjson serializza nativamente
+    return ORJSONResponse(chart_data)
+
+@app.get("/api/chart-data-batch")
+async def get_chart_data_batch(symbols: str, timeframe: str = "1d"):
+    """Ottiene i dati per il grafico di più simboli (separati da virgola) in parallelo."""
+    symbol_list = [s.strip() for s in symbols.split(",") if s.strip()]
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(THREAD_POOL, get_ohlc_data, symbol, timeframe)
+        for symbol in symbol_list
+    ))
+    return ORJSONResponse(dict(zip(symbol_list, results)))
 
 @app.get("/api/bot-status")
 async def get_bot_status():
     """Ottiene lo stato attuale del bot."""
     try:
         # Aggiorna lo stato del throttling
-        throttling_level = api_usage_tracker.get_throttling_level()
-        bot_state["throttling_config"]["current_level"] = throttling_level
-        
-        # Aggiorna il limite giornaliero
-        import dotenv
-        dotenv.load_dotenv()
-        daily_limit = os.getenv("DEEPSEEK_DAILY_LIMIT", "5.0")
-        bot_state["daily_limit"] = float(daily_limit)
+        throttling_level = _cached_tracker_call("throttling_level", api_usage_tracker.get_throttling_level)
+        with _STATE_LOCK:
+            bot_state["throttling_config"]["current_level"] = throttling_level
         
-        return bot_state
+        return _snapshot_bot_state()
     except Exception as e:
         logger.error(f"Errore nell'ottenimento dello stato del bot: {e}")
-        return bot_state
+        return _snapshot_bot_state()
 
 @app.post("/api/bot-control")
 async def control_bot(request: BotControlRequest, background_tasks: BackgroundTasks):
@@ -307,12 +489,14 @@ async def control_bot(request: BotControlRequest, background_tasks: BackgroundTa
     global bot_state
     
     if request.action == "start":
-        bot_state["status"] = "running"
+        with _STATE_LOCK:
+            bot_state["status"] = "running"
         # Avvia il motore dei segnali
         start_signal_engine(background_tasks)
         return {"success": True, "message": "Bot avviato con successo"}
     elif request.action == "stop":
-        bot_state["status"] = "stopped"
+        with _STATE_LOCK:
+            bot_state["status"] = "stopped"
         return {"success": True, "message": "Bot arrestato con successo"}
     else:
         raise HTTPException(status_code=400, detail="Azione non valida")
@@ -323,21 +507,19 @@ async def update_config(request: ConfigUpdateRequest):
     global bot_state
     
     try:
-        # Aggiorna il limite giornaliero
-        if request.daily_limit is not None:
-            bot_state["daily_limit"] = request.daily_limit
-            # Aggiorna anche il file .env
-            import dotenv
-            dotenv_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
-            dotenv.load_dotenv(dotenv_file)
-            dotenv.set_key(dotenv_file, "DEEPSEEK_DAILY_LIMIT", str(request.daily_limit))
+        with _STATE_LOCK:
+            # Aggiorna il limite giornaliero
+            if request.daily_limit is not None:
+                bot_state["daily_limit"] = request.daily_limit
+                # Aggiorna anche il file .env
+                dotenv.set_key(str(DOTENV_FILE), "DEEPSEEK_DAILY_LIMIT", str(request.daily_limit))
         
-        # Aggiorna lo stato di DeepSeek
-        if request.deepseek_enabled is not None:
-            bot_state["deepseek_enabled"] = request.deepseek_enabled
-            # Potrebbe essere necessario aggiornare un flag nel modulo deepseek_utils
+            # Aggiorna lo stato di DeepSeek
+            if request.deepseek_enabled is not None:
+                bot_state["deepseek_enabled"] = request.deepseek_enabled
+                # Potrebbe essere necessario aggiornare un flag nel modulo deepseek_utils
         
-        bot_state["last_update"] = datetime.now().isoformat()
+            bot_state["last_update"] = datetime.now().isoformat()
         return {"success": True, "message": "Configurazione aggiornata con successo"}
     except Exception as e:
         logger.error(f"Errore nell'aggiornamento della configurazione: {e}")
@@ -349,49 +531,63 @@ async def update_throttling(request: ThrottlingConfigRequest):
     global bot_state
     
     try:
-        # Aggiorna la configurazione del throttling
-        if request.normal_threshold is not None:
-            bot_state["throttling_config"]["normal_threshold"] = request.normal_threshold
-            api_usage_tracker.set_threshold("normal", request.normal_threshold)
+        with _STATE_LOCK:
+            # Aggiorna la configurazione del throttling
+            if request.normal_threshold is not None:
+                bot_state["throttling_config"]["normal_threshold"] = request.normal_threshold
+                api_usage_tracker.set_threshold("normal", request.normal_threshold)
         
-        if request.light_threshold is not None:
-            bot_state["throttling_config"]["light_threshold"] = request.light_threshold
-            api_usage_tracker.set_threshold("light", request.light_threshold)
+            if request.light_threshold is not None:
+                bot_state["throttling_config"]["light_threshold"] = request.light_threshold
+                api_usage_tracker.set_threshold("light", request.light_threshold)
         
-        if request.moderate_threshold is not None:
-            bot_state["throttling_config"]["moderate_threshold"] = request.moderate_threshold
-            api_usage_tracker.set_threshold("moderate", request.moderate_threshold)
+            if request.moderate_threshold is not None:
+                bot_state["throttling_config"]["moderate_threshold"] = request.moderate_threshold
+                api_usage_tracker.set_threshold("moderate", request.moderate_threshold)
         
-        if request.heavy_threshold is not None:
-            bot_state["throttling_config"]["heavy_threshold"] = request.heavy_threshold
-            api_usage_tracker.set_threshold("heavy", request.heavy_threshold)
+            if request.heavy_threshold is not None:
+                bot_state["throttling_config"]["heavy_threshold"] = request.heavy_threshold
+                api_usage_tracker.set_threshold("heavy", request.heavy_threshold)
         
-        if request.inactive_market_multiplier is not None:
-            bot_state["throttling_config"]["inactive_market_multiplier"] = request.inactive_market_multiplier
-            api_usage_tracker.set_inactive_market_multiplier(request.inactive_market_multiplier)
+            if request.inactive_market_multiplier is not None:
+                bot_state["throttling_config"]["inactive_market_multiplier"] = request.inactive_market_multiplier
+                api_usage_tracker.set_inactive_market_multiplier(request.inactive_market_multiplier)
         
-        bot_state["last_update"] = datetime.now().isoformat()
+            bot_state["last_update"] = datetime.now().isoformat()
+        
+        # I valori del tracker sono cambiati: invalida la cache
+        TRACKER_CACHE.clear()
         return {"success": True, "message": "Configurazione throttling aggiornata con successo"}
     except Exception as e:
         logger.error(f"Errore nell'aggiornamento della configurazione throttling: {e}")
         raise HTTPException(status_code=500, detail=f"Errore nell'aggiornamento della configurazione throttling: {str(e)}")
 
-# Monta i file statici della dashboard React
-@app.on_event("startup")
-async def startup_event():
-    """Evento di avvio del server."""
-    # Verifica la presenza della cartella della dashboard React
-    static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "web-dashboard/build")
-    if os.path.exists(static_dir):
-        app.mount("/", StaticFiles(directory=static_dir, html=True), name="static")
-        logger.info(f"Interfaccia React montata da {static_dir}")
-    else:
-        logger.warning(f"Directory dell'interfaccia React non trovata: {static_dir}")
+# Monta i file statici della dashboard React una sola volta all'import.
+# Il mount su "/" viene registrato dopo le route /api/*, che restano quindi le prime a essere valutate.
+STATIC_DIR = BASE_DIR / "web-dashboard" / "build"
+if STATIC_DIR.is_dir():
+    app.mount("/", StaticFiles(directory=STATIC_DIR, html=True), name="static")
+    logger.info(f"Interfaccia React montata da {STATIC_DIR}")
+else:
+    logger.warning(f"Directory dell'interfaccia React non trovata: {STATIC_DIR}")
 
 # Avvio del server
 if __name__ == "__main__":
     # Crea la directory dei log se non esiste
-    log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs")
+    log_dir = BASE_DIR / "logs"
     os.makedirs(log_dir, exist_ok=True)
     
-    uvicorn.run("api_server:app", host="0.0.0.0", port=8000, reload=True)
+    # Il reload è pensato solo per lo sviluppo (RELOAD=1) ed è incompatibile con più worker.
+    # Lo stato del bot è in memoria per processo: aumentare WORKERS solo se accettabile.
+    reload = bool(int(os.getenv("RELOAD", "0")))
+    workers = 1 if reload else int(os.getenv("WORKERS", "1"))
+    
+    uvicorn.run(
+        "api_server:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=reload,
+        workers=workers,
+        loop="uvloop" if UVLOOP_AVAILABLE else "asyncio",
+        http="httptools" if HTTPTOOLS_AVAILABLE else "h11"
+    )
@@ -14,14 +14,29 @@ Copyright (c) 2025 Immaginet Srl
 """
 
 import os
+import sys
 import json
 import time
+import atexit
+import bisect
+import random
 import logging
 import threading
+import numpy as np
+from collections import defaultdict
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Set, Optional, Tuple, Any
 
+_rand = random.random
+
+# Try importing orjson for faster JSON serialization
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -33,6 +48,18 @@ logger = logging.getLogger("api_usage_tracker")
 USAGE_DATA_DIR = Path("api_usage")
 USAGE_DATA_FILE = USAGE_DATA_DIR / "usage_data.json"
 MARKET_STATUS_FILE = USAGE_DATA_DIR / "market_status.json"
+EVENT_LOG_PATTERN = "events-{generation}.ndjson"  # Log append-only delle richieste successive allo snapshot
+EVENT_LOG_BUFFER_SIZE = 64 * 1024
+WRITE_BUFFER_SIZE = 256 * 1024
+
+# Scrittura differita dei dati di utilizzo
+FLUSH_INTERVAL_SECONDS = 5.0  # Ritardo massimo tra la prima modifica e il salvataggio su disco
+FLUSH_MAX_PENDING = 50        # Salva subito dopo questo numero di modifiche non salvate
+
+# Storico aggregato: bucket con ampiezza esponenziale (in giorni con traffico), dal più recente.
+# La memoria resta O(log T) qualunque sia la durata di esecuzione.
+HISTORY_BUCKET_SPANS = (1, 2, 4, 8, 16, 32)
+MONTH_WINDOW_DAYS = 30  # Finestra (in giorni di calendario) per il report mensile
 
 # Default settings
 DEFAULT_DAILY_COST_LIMIT = 5.0  # $5 per day
@@ -45,6 +72,13 @@ DEFAULT_THROTTLING_LEVELS = {
     "critical": 0.05    # Riduzione al 5%
 }
 
+# Soglie (% del limite giornaliero) oltre le quali si passa al livello successivo
+THROTTLING_THRESHOLDS_PCT = (50, 75, 90, 100)
+THROTTLING_LEVEL_NAMES = tuple(DEFAULT_THROTTLING_LEVELS)  # normal, light, moderate, heavy, critical
+
+# Frazione della probabilità di esecuzione concessa ai mercati non attivi
+INACTIVE_MARKET_FACTOR = 0.2  # 20% della probabilità normale
+
 # Configurazione per diversi tipi di analisi
 ANALYSIS_CONFIG = {
     "news_bias": {
@@ -104,6 +138,28 @@ ANALYSIS_CONFIG = {
     }
 }
 
+# Chiavi internate: le ricerche nei dizionari con i tipi di richiesta noti si risolvono per identità
+ANALYSIS_CONFIG = {sys.intern(k): v for k, v in ANALYSIS_CONFIG.items()}
+
+def _json_dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serializza in JSON (bytes) usando orjson se disponibile."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None).encode("utf-8")
+
+def _atomic_write(path: Path, payload: bytes):
+    """Scrive i dati in un file temporaneo con una sola write e lo sostituisce atomicamente."""
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+def _json_loads(data: bytes) -> Any:
+    """Deserializza JSON da bytes usando orjson se disponibile."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
 class APIUsageTracker:
     """Classe per monitorare l'utilizzo dell'API e applicare throttling adattivo."""
     
@@ -115,70 +171,358 @@ class APIUsageTracker:
             daily_cost_limit: Limite di costo giornaliero in dollari
         """
         self.daily_cost_limit = daily_cost_limit
-        self.lock = threading.Lock()
-        self.current_throttling_level = "normal"
+        # Lock separati per sottosistema: i dati di utilizzo e i mercati attivi sono indipendenti
+        self._usage_lock = threading.Lock()
+        self._markets_lock = threading.Lock()
+        # Stato derivato dal livello di throttling, ricalcolato solo al cambio di livello
+        self._throttle_factor = 1.0
+        self._inactive_market_prob = INACTIVE_MARKET_FACTOR
+        self._interval_seconds_by_type: Dict[str, float] = {}
+        self._unrestricted_types: frozenset = frozenset()
+        self._set_throttling_level("normal")
+        
+        # Stima (token, costo) per tipo di richiesta: dipende solo da ANALYSIS_CONFIG
+        self._cost_table: Dict[str, Tuple[int, float]] = {
+            rt: (cfg.get("avg_tokens", 500), (cfg.get("avg_tokens", 500) / 1000) * DEFAULT_TOKEN_COST_PER_1K)
+            for rt, cfg in ANALYSIS_CONFIG.items()
+        }
         self.active_markets = set()
-        self.last_requests = {}  # Timestamp delle ultime richieste per tipo
+        # Istante (time.monotonic) dell'ultima richiesta per tipo: scritto e letto senza lock
+        # (l'assegnazione di una chiave è atomica in CPython, una lettura vecchia sposta di poco
+        # la decisione). L'orologio monotono non salta indietro con NTP o cambi d'ora.
+        self._last_req_ts: Dict[str, float] = {}
+        
+        # Contatori piatti della giornata corrente: (tipo, mercato) -> [token, costo, conteggio].
+        # (None, None) contiene il totale del giorno, (tipo, None) il totale per tipo.
+        self._day = ""
+        self._counters: Dict[Tuple[Optional[str], Optional[str]], List] = defaultdict(lambda: [0, 0.0, 0])
+        
+        # Data odierna in cache, ricalcolata solo dopo la mezzanotte locale
+        self._today_str = ""
+        self._today_ordinal = 0
+        self._today_expires_at = 0.0
+        # Timestamp ISO in cache, riformattato al massimo una volta al secondo
+        self._iso_cache: Tuple[int, str] = (0, "")
+        
+        # Stato della scrittura differita: le modifiche marcano i dati come "dirty" e
+        # svegliano il thread in background, che resta fermo finché non c'è nulla da salvare
+        self._dirty = False
+        self._pending_changes = 0
+        self._compaction_requested = False
+        self._markets_dirty = False
+        self._flush_cv = threading.Condition()
+        self._flush_pending = False  # Protetti da _flush_cv
+        self._flush_urgent = False
         
         # Assicurati che la directory esista
         USAGE_DATA_DIR.mkdir(exist_ok=True)
         
-        # Carica i dati di utilizzo esistenti
+        # Carica lo snapshot, riapplica il log degli eventi e aprilo in append
         self._load_usage_data()
+        self._replay_event_log()
+        self._event_fp = open(self._event_log_path(), 'ab', buffering=EVENT_LOG_BUFFER_SIZE)
         self._load_market_status()
         
+        # Avvia il thread di salvataggio e salva le modifiche residue all'uscita
+        self._flusher_thread = threading.Thread(target=self._flusher, name="usage-flusher", daemon=True)
+        self._flusher_thread.start()
+        atexit.register(self._flush_now)
+        
+    def _today(self) -> str:
+        """Restituisce la data odierna (YYYY-MM-DD), formattandola solo al cambio di giorno."""
+        now = time.time()
+        if now >= self._today_expires_at:
+            today = datetime.fromtimestamp(now)
+            self._today_str = today.strftime("%Y-%m-%d")
+            self._today_ordinal = today.toordinal()
+            next_midnight = datetime.combine(today.date() + timedelta(days=1), datetime.min.time())
+            self._today_expires_at = next_midnight.timestamp()
+        return self._today_str
+    
+    def _now_iso(self) -> str:
+        """Restituisce l'ora locale corrente in formato ISO, con risoluzione al secondo."""
+        now = int(time.time())
+        # Tupla sostituita in un colpo solo: sicura anche senza lock tra thread diversi
+        cached_ts, cached_iso = self._iso_cache
+        if now != cached_ts:
+            cached_iso = datetime.fromtimestamp(now).isoformat()
+            self._iso_cache = (now, cached_iso)
+        return cached_iso
+    
     def _load_usage_data(self):
         """Carica i dati di utilizzo dal file di storage."""
+        needs_save = False
         try:
             if USAGE_DATA_FILE.exists():
-                with open(USAGE_DATA_FILE, 'r') as f:
-                    self.usage_data = json.load(f)
+                with open(USAGE_DATA_FILE, 'rb') as f:
+                    self.usage_data = _json_loads(f.read())
+                if "today" not in self.usage_data:
+                    # Lo snapshot convertito copre gli stessi eventi: il log corrente resta valido
+                    self._migrate_usage_data(self.usage_data)
+                    needs_save = True
             else:
                 self.usage_data = self._create_empty_usage_data()
-                self._save_usage_data()
+                needs_save = True
         except Exception as e:
             logger.error(f"Errore nel caricamento dei dati di utilizzo: {e}")
             self.usage_data = self._create_empty_usage_data()
+        
+        # Il dettaglio del giorno vive nei contatori piatti, non nel dizionario annidato
+        self._load_day(self.usage_data.pop("today"))
+        if needs_save:
+            self._save_usage_data()
     
     def _create_empty_usage_data(self):
         """Crea una struttura vuota per i dati di utilizzo."""
-        today = datetime.now().strftime("%Y-%m-%d")
         return {
-            "days": {
-                today: {
-                    "total_tokens": 0,
-                    "estimated_cost": 0.0,
-                    "requests_count": 0,
-                    "by_type": {}
-                }
-            },
-            "current_month": {
-                "total_tokens": 0,
-                "estimated_cost": 0.0,
-                "requests_count": 0
-            },
+            "today": self._create_empty_day(self._today()),
+            "history": [None] * len(HISTORY_BUCKET_SPANS),
             "throttling": {
                 "current_level": "normal",
-                "last_updated": datetime.now().isoformat()
+                "last_updated": self._now_iso()
             },
-            "last_request_time": datetime.now().isoformat()
+            "last_request_time": self._now_iso()
+        }
+    
+    def _create_empty_day(self, day: str) -> Dict:
+        """Crea i contatori vuoti (con dettaglio per tipo e mercato) per una giornata."""
+        return {
+            "date": day,
+            "total_tokens": 0,
+            "estimated_cost": 0.0,
+            "requests_count": 0,
+            "by_type": {}
         }
     
+    def _load_day(self, day_data: Dict):
+        """Carica nei contatori piatti il dettaglio annidato di una giornata."""
+        self._day = day_data["date"]
+        self._counters.clear()
+        self._counters[(None, None)] = [day_data["total_tokens"], day_data["estimated_cost"],
+                                        day_data["requests_count"]]
+        for request_type, type_data in day_data["by_type"].items():
+            request_type = sys.intern(request_type)
+            self._counters[(request_type, None)] = [
+                type_data["tokens"], (type_data["tokens"] / 1000) * DEFAULT_TOKEN_COST_PER_1K, type_data["count"]]
+            for market, market_data in type_data["markets"].items():
+                self._counters[(request_type, market)] = [
+                    market_data["tokens"], (market_data["tokens"] / 1000) * DEFAULT_TOKEN_COST_PER_1K,
+                    market_data["count"]]
+    
+    def _day_to_json(self) -> Dict:
+        """Ricostruisce dai contatori piatti il dettaglio annidato della giornata corrente."""
+        day_data = self._create_empty_day(self._day)
+        by_type = day_data["by_type"]
+        for (request_type, market), (tokens, cost, count) in self._counters.items():
+            if request_type is None:
+                day_data["total_tokens"] = tokens
+                day_data["estimated_cost"] = cost
+                day_data["requests_count"] = count
+                continue
+            type_data = by_type.setdefault(request_type, {"tokens": 0, "count": 0, "markets": {}})
+            if market is None:
+                type_data["tokens"] = tokens
+                type_data["count"] = count
+            else:
+                type_data["markets"][market] = {"tokens": tokens, "count": count}
+        return day_data
+    
+    def _snapshot(self) -> Dict:
+        """Stato completo da salvare su disco, con il dettaglio del giorno ri-annidato."""
+        snapshot = dict(self.usage_data)
+        snapshot["today"] = self._day_to_json()
+        return snapshot
+    
+    def _migrate_usage_data(self, old_data: Dict):
+        """Converte il vecchio formato con un nodo per ogni giorno nello storico a bucket."""
+        self.usage_data = self._create_empty_usage_data()
+        self._load_day(self.usage_data.pop("today"))
+        self._day = ""
+        for key in ("throttling", "last_request_time", "log_generation"):
+            if key in old_data:
+                self.usage_data[key] = old_data[key]
+        
+        for day, day_data in sorted(old_data.get("days", {}).items()):
+            self._close_day(day)
+            self._load_day(dict(day_data, date=day))
+        
+        if not self._day:
+            self._day = self._today()
+        self.usage_data["today"] = self._day_to_json()
+        logger.info("Dati di utilizzo convertiti nel formato con storico aggregato")
+    
+    def _close_day(self, new_day: str):
+        """
+        Chiude la giornata corrente nello storico aggregato e ne apre una nuova.
+        
+        Il totale del giorno entra nel bucket 0; un bucket pieno cede il posto e scala
+        nel successivo, dove si fonde se la somma dei giorni rientra nella sua ampiezza.
+        Ciò che esce dall'ultimo bucket viene scartato.
+        """
+        total_tokens, total_cost, total_count = self._counters.get((None, None), (0, 0.0, 0))
+        if total_count:
+            day_ordinal = datetime.strptime(self._day, "%Y-%m-%d").toordinal()
+            carry = {
+                "start_day": day_ordinal,
+                "end_day": day_ordinal,
+                "days": 1,
+                "total_tokens": total_tokens,
+                "estimated_cost": total_cost,
+                "requests_count": total_count
+            }
+            history = self.usage_data["history"]
+            for i, span in enumerate(HISTORY_BUCKET_SPANS):
+                bucket = history[i]
+                if bucket is None:
+                    history[i] = carry
+                    break
+                if bucket["days"] + carry["days"] <= span:
+                    # carry è più recente del bucket in cui si fonde
+                    bucket["end_day"] = carry["end_day"]
+                    bucket["days"] += carry["days"]
+                    bucket["total_tokens"] += carry["total_tokens"]
+                    bucket["estimated_cost"] += carry["estimated_cost"]
+                    bucket["requests_count"] += carry["requests_count"]
+                    break
+                history[i], carry = carry, bucket
+        
+        self._day = new_day
+        self._counters.clear()
+    
     def _save_usage_data(self):
         """Salva i dati di utilizzo nel file di storage."""
         try:
-            with self.lock:
-                with open(USAGE_DATA_FILE, 'w') as f:
-                    json.dump(self.usage_data, f, indent=2)
+            # Serializza sotto lock, scrivi su disco fuori dal lock
+            with self._usage_lock:
+                payload = _json_dumps(self._snapshot())
+            
+            _atomic_write(USAGE_DATA_FILE, payload)
+        except Exception as e:
+            logger.error(f"Errore nel salvataggio dei dati di utilizzo: {e}")
+    
+    def _event_log_path(self, generation: Optional[int] = None) -> Path:
+        """Percorso del log degli eventi per una generazione di snapshot."""
+        if generation is None:
+            generation = self.usage_data.get("log_generation", 0)
+        return USAGE_DATA_DIR / EVENT_LOG_PATTERN.format(generation=generation)
+    
+    def _replay_event_log(self):
+        """Riapplica allo snapshot gli eventi registrati dopo il suo salvataggio."""
+        current_log = self._event_log_path()
+        
+        # Rimuovi i log di generazioni già compattate (es. crash durante una compattazione)
+        for log_file in USAGE_DATA_DIR.glob(EVENT_LOG_PATTERN.format(generation="*")):
+            if log_file != current_log:
+                log_file.unlink(missing_ok=True)
+        
+        if not current_log.exists():
+            return
+        
+        replayed = 0
+        with open(current_log, 'rb') as f:
+            for line in f:
+                try:
+                    event = _json_loads(line)
+                except ValueError:
+                    # Riga troncata da un'interruzione durante la scrittura
+                    continue
+                event_day = datetime.fromtimestamp(event["t"]).strftime("%Y-%m-%d")
+                self._apply_request(event["type"], event["tokens"], event.get("market"), event_day)
+                replayed += 1
+        
+        if replayed:
+            self._update_throttling_level()
+            logger.info(f"Riapplicati {replayed} eventi dal log di utilizzo")
+    
+    def _compact(self):
+        """Scrive un nuovo snapshot e avvia un log vuoto (da chiamare con _usage_lock acquisito).
+        
+        Se la scrittura fallisce lo stato resta invariato: gli eventi continuano nel log
+        corrente e la compattazione viene ritentata al salvataggio successivo.
+        """
+        self._event_fp.flush()
+        old_log = self._event_log_path()
+        
+        # Lo snapshot punta alla nuova generazione: se il processo si interrompe prima,
+        # all'avvio si riparte dal vecchio snapshot e dal vecchio log senza doppi conteggi
+        new_generation = self.usage_data.get("log_generation", 0) + 1
+        new_log = self._event_log_path(new_generation)
+        snapshot = self._snapshot()
+        snapshot["log_generation"] = new_generation
+        
+        # Il nuovo log viene aperto prima dello snapshot, così dopo una scrittura riuscita
+        # il passaggio alla nuova generazione non può più fallire
+        new_fp = open(new_log, 'ab', buffering=EVENT_LOG_BUFFER_SIZE)
+        try:
+            _atomic_write(USAGE_DATA_FILE, _json_dumps(snapshot))
+        except Exception:
+            new_fp.close()
+            new_log.unlink(missing_ok=True)
+            raise
+        
+        self._event_fp.close()
+        self._event_fp = new_fp
+        self.usage_data["log_generation"] = new_generation
+        old_log.unlink(missing_ok=True)
+        self._compaction_requested = False
+    
+    def _mark_dirty(self, changes: int = 1):
+        """Segnala che i dati di utilizzo sono cambiati (da chiamare con _usage_lock acquisito)."""
+        was_dirty = self._dirty
+        self._dirty = True
+        self._pending_changes += changes
+        urgent = self._pending_changes >= FLUSH_MAX_PENDING or self._compaction_requested
+        # Il flusher va avvisato solo alla prima modifica dopo un salvataggio o quando serve subito
+        if not was_dirty or urgent:
+            self._request_flush(urgent)
+    
+    def _request_flush(self, urgent: bool = False):
+        """Sveglia il flusher; le richieste successive alla prima vengono accorpate."""
+        with self._flush_cv:
+            if not self._flush_pending:
+                self._flush_pending = True
+                self._flush_urgent = urgent
+                self._flush_cv.notify()
+            elif urgent and not self._flush_urgent:
+                self._flush_urgent = True
+                self._flush_cv.notify()
+    
+    def _flush_now(self):
+        """Scrive su disco gli eventi in buffer e, se richiesto, compatta il log in uno snapshot."""
+        try:
+            with self._usage_lock:
+                if self._dirty:
+                    self._event_fp.flush()
+                    self._dirty = False
+                    self._pending_changes = 0
+                if self._compaction_requested:
+                    self._compact()
         except Exception as e:
             logger.error(f"Errore nel salvataggio dei dati di utilizzo: {e}")
+        
+        # Lo stato dei mercati ha un lock proprio e viene salvato solo se è cambiato
+        if self._markets_dirty:
+            self._save_market_status()
+    
+    def _flusher(self):
+        """Thread in background che salva i dati modificati, senza risvegli a vuoto."""
+        while True:
+            with self._flush_cv:
+                while not self._flush_pending:
+                    self._flush_cv.wait()
+                # Accorpa le modifiche successive fino a FLUSH_INTERVAL_SECONDS, salvo urgenze
+                if not self._flush_urgent:
+                    self._flush_cv.wait(timeout=FLUSH_INTERVAL_SECONDS)
+                self._flush_pending = False
+                self._flush_urgent = False
+            self._flush_now()
     
     def _load_market_status(self):
         """Carica lo stato dei mercati dal file di storage."""
         try:
             if MARKET_STATUS_FILE.exists():
-                with open(MARKET_STATUS_FILE, 'r') as f:
-                    market_data = json.load(f)
+                with open(MARKET_STATUS_FILE, 'rb') as f:
+                    market_data = _json_loads(f.read())
                     self.active_markets = set(market_data.get("active_markets", []))
             else:
                 self.active_markets = set()
@@ -190,14 +534,17 @@ class APIUsageTracker:
     def _save_market_status(self):
         """Salva lo stato dei mercati nel file di storage."""
         try:
-            with self.lock:
+            # Copia i dati sotto lock, scrivi su disco fuori dal lock
+            with self._markets_lock:
                 market_data = {
                     "active_markets": list(self.active_markets),
-                    "last_updated": datetime.now().isoformat()
+                    "last_updated": self._now_iso()
                 }
-                with open(MARKET_STATUS_FILE, 'w') as f:
-                    json.dump(market_data, f, indent=2)
+                self._markets_dirty = False
+            
+            _atomic_write(MARKET_STATUS_FILE, _json_dumps(market_data))
         except Exception as e:
+            self._markets_dirty = True  # Riprova al prossimo flush
             logger.error(f"Errore nel salvataggio dello stato dei mercati: {e}")
     
     def update_active_markets(self, markets: List[str]):
@@ -207,9 +554,16 @@ class APIUsageTracker:
         Args:
             markets: Lista di simboli di mercato attivi
         """
-        with self.lock:
-            self.active_markets = set(markets)
-            self._save_market_status()
+        new_markets = set(markets)
+        with self._markets_lock:
+            # Nessuna modifica, nessuna scrittura: il caso più frequente nei refresh periodici
+            if new_markets == self.active_markets:
+                return
+            # Copy-on-write: i lettori senza lock vedono sempre un insieme completo
+            self.active_markets = new_markets
+            self._markets_dirty = True
+        # Il salvataggio su disco avviene nel thread in background
+        self._request_flush()
     
     def is_market_active(self, market: str) -> bool:
         """
@@ -221,6 +575,7 @@ class APIUsageTracker:
         Returns:
             True se il mercato è attivo, False altrimenti
         """
+        # Nessun lock: l'insieme viene sostituito per intero, mai modificato sul posto
         return market in self.active_markets
     
     def track_request(self, request_type: str, token_count: int, market: Optional[str] = None):
@@ -228,90 +583,149 @@ class APIUsageTracker:
         Registra una richiesta API completata.
         
         Args:
-            request_type: Tipo di richiesta (es. "news_bias", "chat")
+            request_type: Tipo di richiesta (es. "news_bias", "chat"); preferire costanti letterali
             token_count: Numero di token utilizzati
             market: Simbolo del mercato se applicabile
         """
-        with self.lock:
-            today = datetime.now().strftime("%Y-%m-%d")
-            
-            # Assicurati che la data odierna esista
-            if today not in self.usage_data["days"]:
-                self.usage_data["days"][today] = {
-                    "total_tokens": 0,
-                    "estimated_cost": 0.0,
-                    "requests_count": 0,
-                    "by_type": {}
-                }
+        request_type = sys.intern(request_type)
+        self._last_req_ts[request_type] = time.monotonic()
+        now = time.time()
+        
+        with self._usage_lock:
+            today = self._today()
             
-            # Aggiorna i dati del giorno
-            self.usage_data["days"][today]["total_tokens"] += token_count
-            cost = (token_count / 1000) * DEFAULT_TOKEN_COST_PER_1K
-            self.usage_data["days"][today]["estimated_cost"] += cost
-            self.usage_data["days"][today]["requests_count"] += 1
+            # Il primo evento di un nuovo giorno compatta il log del giorno precedente
+            if self._day != today:
+                self._compaction_requested = True
             
-            # Aggiorna i dati per tipo
-            if request_type not in self.usage_data["days"][today]["by_type"]:
-                self.usage_data["days"][today]["by_type"][request_type] = {
-                    "tokens": 0,
-                    "count": 0,
-                    "markets": {}
-                }
+            self._apply_request(request_type, token_count, market, today)
             
-            self.usage_data["days"][today]["by_type"][request_type]["tokens"] += token_count
-            self.usage_data["days"][today]["by_type"][request_type]["count"] += 1
+            # Aggiorna il timestamp dell'ultima richiesta
+            self.usage_data["last_request_time"] = self._now_iso()
             
-            # Aggiorna i dati per mercato se specificato
-            if market:
-                if market not in self.usage_data["days"][today]["by_type"][request_type]["markets"]:
-                    self.usage_data["days"][today]["by_type"][request_type]["markets"][market] = {
-                        "tokens": 0,
-                        "count": 0
-                    }
-                
-                self.usage_data["days"][today]["by_type"][request_type]["markets"][market]["tokens"] += token_count
-                self.usage_data["days"][today]["by_type"][request_type]["markets"][market]["count"] += 1
+            # Ricalcola il livello di throttling in base all'utilizzo
+            self._update_throttling_level()
             
-            # Aggiorna i dati del mese
-            self.usage_data["current_month"]["total_tokens"] += token_count
-            self.usage_data["current_month"]["estimated_cost"] += cost
-            self.usage_data["current_month"]["requests_count"] += 1
+            # Registra l'evento nel log append-only; il flush su disco avviene in background
+            event = {"t": now, "type": request_type, "tokens": token_count, "market": market}
+            self._event_fp.write(_json_dumps(event) + b"\n")
+            self._mark_dirty()
+    
+    def track_requests_bulk(self, types: List[str], tokens: np.ndarray,
+                            markets: Optional[List[Optional[str]]] = None):
+        """
+        Registra in blocco un insieme di richieste API completate.
+        
+        Le somme per tipo e mercato sono calcolate con np.bincount, così i contatori
+        vengono aggiornati una volta per gruppo e il log riceve una sola scrittura.
+        
+        Args:
+            types: Tipi di richiesta
+            tokens: Token utilizzati da ciascuna richiesta
+            markets: Simboli di mercato (None dove non applicabile)
+        """
+        n = len(types)
+        if n == 0:
+            return
+        tokens = np.asarray(tokens, dtype=np.int64)
+        if markets is None:
+            markets = [None] * n
+        
+        type_names, type_codes = np.unique(np.asarray(types, dtype=object), return_inverse=True)
+        type_names = [sys.intern(t) for t in type_names]
+        market_names, market_codes = np.unique(
+            np.asarray([m or "" for m in markets], dtype=object), return_inverse=True)
+        
+        # Un codice per coppia (tipo, mercato), poi somme e conteggi in un solo passaggio
+        group_codes = type_codes * len(market_names) + market_codes
+        n_groups = len(type_names) * len(market_names)
+        group_tokens = np.bincount(group_codes, weights=tokens, minlength=n_groups)
+        group_counts = np.bincount(group_codes, minlength=n_groups)
+        
+        now_mono = time.monotonic()
+        for request_type in type_names:
+            self._last_req_ts[request_type] = now_mono
+        now = time.time()
+        
+        events = b"".join(
+            _json_dumps({"t": now, "type": t, "tokens": int(k), "market": m}) + b"\n"
+            for t, k, m in zip(types, tokens, markets)
+        )
+        
+        with self._usage_lock:
+            today = self._today()
+            if self._day != today:
+                self._compaction_requested = True
             
-            # Aggiorna il timestamp dell'ultima richiesta
-            self.usage_data["last_request_time"] = datetime.now().isoformat()
-            self.last_requests[request_type] = time.time()
+            for group in np.flatnonzero(group_counts):
+                type_idx, market_idx = divmod(int(group), len(market_names))
+                self._apply_request(type_names[type_idx], int(group_tokens[group]),
+                                    market_names[market_idx] or None, today,
+                                    count=int(group_counts[group]))
             
-            # Ricalcola il livello di throttling in base all'utilizzo
+            self.usage_data["last_request_time"] = self._now_iso()
             self._update_throttling_level()
             
-            # Salva i dati aggiornati
-            self._save_usage_data()
+            self._event_fp.write(events)
+            self._mark_dirty(n)
+    
+    def _apply_request(self, request_type: str, token_count: int, market: Optional[str], today: str,
+                       count: int = 1):
+        """Aggiorna i contatori in memoria per `count` richieste con `token_count` token complessivi
+        (usato anche nel replay del log e negli inserimenti in blocco)."""
+        # Al cambio di giorno il dettaglio di ieri confluisce nello storico aggregato;
+        # eventi con una data precedente (es. orologio spostato) restano nel giorno corrente
+        if today > self._day:
+            self._close_day(today)
+        
+        # Totale del giorno, totale per tipo e, se specificato, dettaglio per mercato
+        cost = (token_count / 1000) * DEFAULT_TOKEN_COST_PER_1K
+        if market:
+            keys = ((None, None), (request_type, None), (request_type, market))
+        else:
+            keys = ((None, None), (request_type, None))
+        
+        counters = self._counters
+        for key in keys:
+            c = counters[key]
+            c[0] += token_count
+            c[1] += cost
+            c[2] += count
     
     def _update_throttling_level(self):
         """Aggiorna il livello di throttling in base all'utilizzo giornaliero."""
-        today = datetime.now().strftime("%Y-%m-%d")
-        daily_cost = self.usage_data["days"].get(today, {}).get("estimated_cost", 0.0)
+        daily_cost = self._daily_totals()[1]
         
         # Determina il livello di throttling in base alla percentuale del limite giornaliero
         percent_of_limit = (daily_cost / self.daily_cost_limit) * 100
         
-        if percent_of_limit < 50:
-            new_level = "normal"
-        elif percent_of_limit < 75:
-            new_level = "light"
-        elif percent_of_limit < 90:
-            new_level = "moderate"
-        elif percent_of_limit < 100:
-            new_level = "heavy"
-        else:
-            new_level = "critical"
+        new_level = THROTTLING_LEVEL_NAMES[bisect.bisect_right(THROTTLING_THRESHOLDS_PCT, percent_of_limit)]
         
         if new_level != self.current_throttling_level:
             logger.info(f"Throttling level changed from {self.current_throttling_level} to {new_level} "
                        f"(Daily cost: ${daily_cost:.2f}, {percent_of_limit:.1f}% of limit)")
-            self.current_throttling_level = new_level
+            self._set_throttling_level(new_level)
             self.usage_data["throttling"]["current_level"] = new_level
-            self.usage_data["throttling"]["last_updated"] = datetime.now().isoformat()
+            self.usage_data["throttling"]["last_updated"] = self._now_iso()
+    
+    def _set_throttling_level(self, level: str):
+        """
+        Imposta il livello di throttling e precalcola le tabelle usate dal controllo di ammissione.
+        
+        Args:
+            level: Nuovo livello di throttling
+        """
+        self.current_throttling_level = level
+        self._throttle_factor = DEFAULT_THROTTLING_LEVELS.get(level, 1.0)
+        self._inactive_market_prob = self._throttle_factor * INACTIVE_MARKET_FACTOR
+        self._interval_seconds_by_type = {
+            rt: cfg["interval_minutes"].get(level, 0) * 60
+            for rt, cfg in ANALYSIS_CONFIG.items()
+        }
+        # Tipi senza intervallo minimo al livello corrente: ammessi senza altri controlli
+        self._unrestricted_types = frozenset(
+            rt for rt, seconds in self._interval_seconds_by_type.items() if seconds == 0
+        )
     
     def get_throttling_level(self) -> str:
         """
@@ -329,25 +743,60 @@ class APIUsageTracker:
         Returns:
             Dizionario con i dati di utilizzo giornaliero
         """
-        today = datetime.now().strftime("%Y-%m-%d")
-        return self.usage_data["days"].get(today, {
-            "total_tokens": 0,
-            "estimated_cost": 0.0,
-            "requests_count": 0,
-            "by_type": {}
-        })
+        today = self._today()
+        if self._day != today:
+            return self._create_empty_day(today)
+        return self._day_to_json()
+    
+    def _daily_totals(self) -> Tuple[int, float, int]:
+        """Token, costo e numero di richieste del giorno corrente, senza ri-annidare il dettaglio."""
+        if self._day != self._today():
+            return 0, 0.0, 0
+        return tuple(self._counters.get((None, None), (0, 0.0, 0)))
+    
+    def get_monthly_usage(self) -> Dict:
+        """
+        Somma l'utilizzo degli ultimi MONTH_WINDOW_DAYS giorni dallo storico aggregato.
+        
+        I bucket a cavallo dell'inizio della finestra sono inclusi per intero,
+        quindi il totale è un'approssimazione per eccesso.
+        
+        Returns:
+            Dizionario con token, costo e numero di richieste
+        """
+        total_tokens, total_cost, total_count = self._daily_totals()
+        monthly = {
+            "total_tokens": total_tokens,
+            "estimated_cost": total_cost,
+            "requests_count": total_count
+        }
+        
+        window_start = self._today_ordinal - MONTH_WINDOW_DAYS
+        for bucket in self.usage_data["history"]:
+            if bucket is not None and bucket["end_day"] > window_start:
+                monthly["total_tokens"] += bucket["total_tokens"]
+                monthly["estimated_cost"] += bucket["estimated_cost"]
+                monthly["requests_count"] += bucket["requests_count"]
+        
+        return monthly
     
     def should_execute_request(self, request_type: str, market: Optional[str] = None) -> bool:
         """
         Determina se una richiesta dovrebbe essere eseguita in base alle regole di throttling.
         
         Args:
-            request_type: Tipo di richiesta (es. "news_bias", "chat")
+            request_type: Tipo di richiesta (es. "news_bias", "chat"); preferire costanti letterali
             market: Simbolo del mercato se applicabile
         
         Returns:
             True se la richiesta dovrebbe procedere, False se dovrebbe essere saltata
         """
+        request_type = sys.intern(request_type)
+        
+        # Percorso rapido: tipo senza limite di frequenza su mercato attivo o generico
+        if request_type in self._unrestricted_types and (not market or market in self.active_markets):
+            return True
+        
         # Chat è sempre permessa (alta priorità), ma con possibili limiti di frequenza
         if request_type == "chat":
             return self._check_request_interval(request_type)
@@ -355,11 +804,7 @@ class APIUsageTracker:
         # Se il mercato è specificato e non è attivo, applica limitazioni più severe
         if market and not self.is_market_active(market):
             # Per mercati non attivi, esegui solo con una probabilità bassa basata sul livello di throttling
-            throttle_factor = DEFAULT_THROTTLING_LEVELS.get(self.current_throttling_level, 1.0)
-            # Riduce ulteriormente la probabilità per mercati non attivi
-            market_factor = 0.2  # 20% della probabilità normale
-            import random
-            return random.random() < (throttle_factor * market_factor) and self._check_request_interval(request_type)
+            return _rand() < self._inactive_market_prob and self._check_request_interval(request_type)
         
         # Per mercati attivi o richieste generiche, usa solo il controllo dell'intervallo
         return self._check_request_interval(request_type)
@@ -374,23 +819,14 @@ class APIUsageTracker:
         Returns:
             True se l'intervallo minimo è rispettato, False altrimenti
         """
-        if request_type not in ANALYSIS_CONFIG:
-            return True  # Tipo di richiesta sconosciuto, permetti sempre
-        
-        # Ottieni l'intervallo minimo basato sul livello di throttling
-        throttle_level = self.current_throttling_level
-        min_interval_minutes = ANALYSIS_CONFIG[request_type]["interval_minutes"].get(throttle_level, 0)
-        
-        # Se l'intervallo è 0, non c'è limite di frequenza
-        if min_interval_minutes == 0:
+        # Intervallo minimo precalcolato per il livello corrente (0 = nessun limite,
+        # anche per i tipi di richiesta sconosciuti)
+        min_interval = self._interval_seconds_by_type.get(request_type, 0)
+        if min_interval == 0:
             return True
         
         # Controlla se è trascorso abbastanza tempo dall'ultima richiesta
-        current_time = time.time()
-        last_request_time = self.last_requests.get(request_type, 0)
-        elapsed_minutes = (current_time - last_request_time) / 60
-        
-        return elapsed_minutes >= min_interval_minutes
+        return time.monotonic() - self._last_req_ts.get(request_type, float("-inf")) >= min_interval
     
     def get_usage_report(self) -> Dict:
         """
@@ -399,21 +835,16 @@ class APIUsageTracker:
         Returns:
             Dizionario con il report di utilizzo
         """
-        today = datetime.now().strftime("%Y-%m-%d")
-        daily_data = self.usage_data["days"].get(today, {})
+        total_tokens, total_cost, total_count = self._daily_totals()
         
         return {
             "daily": {
-                "total_tokens": daily_data.get("total_tokens", 0),
-                "estimated_cost": daily_data.get("estimated_cost", 0.0),
-                "requests_count": daily_data.get("requests_count", 0),
-                "percent_of_limit": (daily_data.get("estimated_cost", 0.0) / self.daily_cost_limit) * 100
-            },
-            "monthly": {
-                "total_tokens": self.usage_data["current_month"]["total_tokens"],
-                "estimated_cost": self.usage_data["current_month"]["estimated_cost"],
-                "requests_count": self.usage_data["current_month"]["requests_count"]
+                "total_tokens": total_tokens,
+                "estimated_cost": total_cost,
+                "requests_count": total_count,
+                "percent_of_limit": (total_cost / self.daily_cost_limit) * 100
             },
+            "monthly": self.get_monthly_usage(),
             "throttling": {
                 "current_level": self.current_throttling_level,
                 "last_updated": self.usage_data["throttling"]["last_updated"]
@@ -421,6 +852,15 @@ class APIUsageTracker:
             "active_markets": list(self.active_markets)
         }
     
+    def dump_report(self) -> str:
+        """
+        Serializza il report di utilizzo in JSON indentato, per la lettura da terminale.
+        
+        Returns:
+            Report in formato JSON leggibile
+        """
+        return _json_dumps(self.get_usage_report(), indent=True).decode("utf-8")
+    
     def set_daily_cost_limit(self, limit: float):
         """
         Imposta un nuovo limite di costo giornaliero.
@@ -428,11 +868,11 @@ class APIUsageTracker:
         Args:
             limit: Nuovo limite in dollari
         """
-        with self.lock:
+        with self._usage_lock:
             self.daily_cost_limit = limit
             # Ricalcola il livello di throttling con il nuovo limite
             self._update_throttling_level()
-            self._save_usage_data()
+            self._mark_dirty()
     
     def estimate_request_cost(self, request_type: str) -> Tuple[int, float]:
         """
@@ -444,10 +884,7 @@ class APIUsageTracker:
         Returns:
             Tupla (token_stimati, costo_stimato)
         """
-        config = ANALYSIS_CONFIG.get(request_type, {"avg_tokens": 500})
-        avg_tokens = config.get("avg_tokens", 500)
-        cost = (avg_tokens / 1000) * DEFAULT_TOKEN_COST_PER_1K
-        return avg_tokens, cost
+        return self._cost_table.get(request_type, (500, (500 / 1000) * DEFAULT_TOKEN_COST_PER_1K))
 
 # Istanza singleton per accesso globale
 _instance = None
@@ -476,6 +913,18 @@ def track_api_call(request_type: str, token_count: int, market: Optional[str] =
     tracker = get_instance()
     tracker.track_request(request_type, token_count, market)
 
+def track_api_calls(types: List[str], tokens: np.ndarray, markets: Optional[List[Optional[str]]] = None):
+    """
+    Traccia in blocco un insieme di chiamate API completate.
+    
+    Args:
+        types: Tipi di richiesta
+        tokens: Token utilizzati da ciascuna chiamata
+        markets: Simboli di mercato (None dove non applicabile)
+    """
+    tracker = get_instance()
+    tracker.track_requests_bulk(types, tokens, markets)
+
 def should_execute_api_call(request_type: str, market: Optional[str] = None) -> bool:
     """
     Determina se una chiamata API dovrebbe essere eseguita in base alle regole di throttling.
@@ -510,6 +959,16 @@ def get_throttling_level() -> str:
     tracker = get_instance()
     return tracker.get_throttling_level()
 
+def get_active_markets() -> List[str]:
+    """
+    Ottiene l'elenco dei mercati attivi.
+    
+    Returns:
+        Lista di simboli di mercato attivi
+    """
+    tracker = get_instance()
+    return list(tracker.active_markets)
+
 def get_usage_report() -> Dict:
     """
     Ottiene un report completo sull'utilizzo.
@@ -543,8 +1002,7 @@ if __name__ == "__main__":
     args = parser.parse_args()
     
     if args.report:
-        report = get_usage_report()
-        print(json.dumps(report, indent=2))
+        print(get_instance().dump_report())
     
     if args.set_limit:
         set_daily_cost_limit(args.set_limit)
@@ -557,26 +1015,22 @@ if __name__ == "__main__":
     if args.simulate:
         print("Simulazione di chiamate API...")
         
-        # Simula una serie di chiamate API
-        for i in range(10):
-            request_type = "news_bias" if i % 3 == 0 else "chat" if i % 3 == 1 else "pattern_recognition"
-            market = f"XAUUSD" if i % 2 == 0 else "WTICOUSD"
-            
-            should_execute = should_execute_api_call(request_type, market)
-            print(f"Request {i+1}: {request_type} for {market} - Execute: {should_execute}")
-            
-            if should_execute:
-                # Simula una chiamata API
-                tokens = 500 if request_type == "chat" else 800 if request_type == "news_bias" else 1200
-                track_api_call(request_type, tokens, market)
-                
-                # Mostra il livello di throttling
-                print(f"  Throttling level: {get_throttling_level()}")
-                
-                # Pausa breve
-                time.sleep(0.5)
+        # Genera i vettori delle chiamate simulate
+        idx = np.arange(10)
+        type_names = np.array(["news_bias", "chat", "pattern_recognition"], dtype=object)
+        token_table = np.array([800, 500, 1200])
+        request_types = type_names[idx % 3]
+        markets = np.where(idx % 2 == 0, "XAUUSD", "WTICOUSD").astype(object)
+        tokens = token_table[idx % 3]
+        
+        # Decidi quali chiamate eseguire in un unico passaggio, poi registrale in blocco
+        execute = np.array([should_execute_api_call(t, m) for t, m in zip(request_types, markets)])
+        for i in idx:
+            print(f"Request {i+1}: {request_types[i]} for {markets[i]} - Execute: {execute[i]}")
+        
+        track_api_calls(list(request_types[execute]), tokens[execute], list(markets[execute]))
+        print(f"  Throttling level: {get_throttling_level()}")
         
         # Mostra il report finale
-        report = get_usage_report()
         print("\nReport finale:")
-        print(json.dumps(report, indent=2))
+        print(get_instance().dump_report())
@@ -14,20 +14,80 @@ Copyright (c) 2025 Immaginet Srl
 
 import os
 import re
+import gzip
+import zlib
+import json
+import string
 import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional, Any, Union
 from datetime import datetime, timedelta
 
+# xxHash (opzionale) per la scelta dello shard: molto più veloce di BLAKE2b su chiavi brevi
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+# Zstandard (opzionale) per i file di cache: decompressione molto più rapida di gzip
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
 # Configurazione logging
 logger = logging.getLogger(__name__)
 
 # Configurazione generale
 MAX_KEY_LENGTH = 128  # Lunghezza massima per una chiave di cache
-HASH_ALGORITHM = 'sha256'  # Algoritmo di hash per le chiavi
+# Algoritmo di hash per le chiavi: BLAKE2b a 128 bit (non serve resistenza crittografica,
+# solo una buona distribuzione). 'sha256' mantiene le chiavi delle cache create in precedenza.
+HASH_ALGORITHM = os.environ.get('CACHE_KEY_HASH_ALGORITHM', 'blake2b')
+
+
+BLAKE2B_DIGEST_SIZE = 16  # Byte del digest BLAKE2b (128 bit)
+
+
+def _blake2b_128(data: bytes):
+    """BLAKE2b con digest a 16 byte (32 caratteri esadecimali)."""
+    return hashlib.blake2b(data, digest_size=BLAKE2B_DIGEST_SIZE)
+
+
+_HASH_FUNCTIONS = {
+    'blake2b': _blake2b_128,
+    'sha256': hashlib.sha256
+}
+# Costruttore diretto, evita la ricerca per nome di hashlib.new a ogni chiamata
+_fast_hash = _HASH_FUNCTIONS.get(HASH_ALGORITHM, _blake2b_128)
 KEY_SEPARATOR = ':'  # Separatore utilizzato per comporre chiavi complesse
 
+# Schema di sharding: byte basso dell'xxh3 a 64 bit della chiave troncata (primo byte del
+# BLAKE2b se xxhash non è installato), cioè 256 sottocartelle distribuite uniformemente per
+# ogni tipo di cache. Lo shard richiede solo uniformità, non resistenza alle collisioni:
+# quella resta compito dell'hash usato da _truncate_key.
+# Lo schema è registrato in LAYOUT_FILE: se cambia (ad es. installando xxhash) la cache
+# viene ridistribuita all'avvio, e lo leggono anche gli strumenti esterni.
+SHARD_SCHEME = 'xxh3-1' if XXHASH_AVAILABLE else 'blake2b-1'
+LAYOUT_FILE = 'cache_layout.json'
+# Formato dei payload su disco: zstd se disponibile, altrimenti gzip. Lo scan e la
+# migrazione riconoscono entrambi i suffissi.
+CACHE_COMPRESSION = 'zstd' if ZSTD_AVAILABLE else 'gzip'
+CACHE_FILE_EXTENSION = '.cache.zst' if ZSTD_AVAILABLE else '.cache.gz'
+CACHE_DATA_SUFFIXES = ('.cache.zst', '.cache.gz')
+CACHE_FILE_SUFFIXES = CACHE_DATA_SUFFIXES + ('.cache.meta.json',)
+ZSTD_LEVEL = 3       # Livello zstd per le scritture normali
+ZSTD_MAX_LEVEL = 19  # Livello zstd per la ricompressione quando la cache è quasi piena
+GZIP_MAX_LEVEL = 3   # Livello gzip per la ricompressione: oltre, su JSON il guadagno è minimo
+# Magic number dei frame compressi: i file scritti senza compressione (payload piccoli)
+# iniziano con altri byte e vengono restituiti così come sono
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+GZIP_MAGIC = b'\x1f\x8b'
+
 # Cartelle per tipi di cache
 CACHE_TYPE_DIRS = {
     'default': 'general',
@@ -42,10 +102,118 @@ CACHE_TYPE_DIRS = {
     'backtest': 'backtest_results'
 }
 
-# Pattern regex per la pulizia delle chiavi
-INVALID_CHARS_PATTERN = re.compile(r'[^\w\-\.]')
-WHITESPACE_PATTERN = re.compile(r'\s+')
-REPEAT_SEPARATORS = re.compile(r'_+')
+# Posizione di ogni tipo di cache nella bitmap delle sottocartelle di shard già create
+_CACHE_TYPE_INDEX = {cache_type: i for i, cache_type in enumerate(CACHE_TYPE_DIRS)}
+SHARDS_PER_TYPE = 256
+
+# Pattern regex per la pulizia delle chiavi (applicato dopo il lowercase): ogni sequenza
+# di caratteri non validi, spazi e underscore compresi, diventa un solo underscore
+_NORMALIZE_RE = re.compile(r'[^a-z0-9\-.]+')
+
+# Percorso rapido per le chiavi ASCII: tabella di traduzione (un solo ciclo in C, senza
+# motore regex) seguita dal collasso degli underscore ripetuti
+_VALID_KEY_CHARS = set(string.ascii_lowercase + string.digits + '-.')
+_TRANS_TABLE = {c: '_' for c in range(128) if chr(c) not in _VALID_KEY_CHARS}
+_COLLAPSE_RE = re.compile(r'_{2,}')
+
+# Forma di una chiave già normalizzata: [a-z0-9.-] con underscore singoli solo all'interno
+_ALREADY_OK = re.compile(r'[a-z0-9\-.]+(?:_[a-z0-9\-.]+)*').fullmatch
+
+
+def _is_already_safe(key: str) -> bool:
+    """Verifica se una chiave è già in forma normalizzata (la normalizzazione non la cambierebbe)."""
+    # isascii() è un controllo O(1) sul flag interno della stringa e scarta subito il testo
+    # non ASCII; fullmatch non alloca stringhe intermedie
+    return key.isascii() and _ALREADY_OK(key) is not None
+
+
+def _normalize_key(key: str) -> str:
+    """Normalizza una chiave di cache (implementazione di CacheKeyManager.normalize_key)."""
+    # Chiavi già sicure (nomi di modello, parti generate dal codice): nessuna elaborazione
+    if _is_already_safe(key):
+        return key
+    
+    # Lowercase e sostituzione dei caratteri non validi, poi rimozione degli underscore
+    # iniziali e finali; la regex serve solo per le chiavi con caratteri non ASCII
+    lowered = key.lower()
+    if lowered.isascii():
+        normalized = _COLLAPSE_RE.sub('_', lowered.translate(_TRANS_TABLE)).strip('_')
+    else:
+        normalized = _NORMALIZE_RE.sub('_', lowered).strip('_')
+    
+    logger.debug(f"Normalized key from '{key}' to '{normalized}'")
+    return normalized
+
+
+def _key_bytes(key: str) -> bytes:
+    """
+    Codifica una chiave per l'hashing.
+    
+    Le chiavi normalizzate contengono solo [a-z0-9._-] e sono quindi ASCII: il codec ascii
+    è una copia diretta della rappresentazione interna a 1 byte per carattere. I byte
+    coincidono con quelli UTF-8, quindi gli hash non cambiano.
+    """
+    return key.encode('ascii') if key.isascii() else key.encode('utf-8')
+
+
+def _hex_digest(data: bytes, want_hex: int) -> str:
+    """
+    Restituisce al massimo want_hex caratteri esadecimali dell'hash dei dati.
+    
+    Con BLAKE2b il digest viene richiesto già della lunghezza necessaria (fino a 128 bit)
+    invece di calcolarlo intero e poi tagliarlo.
+    """
+    if HASH_ALGORITHM == 'sha256':
+        return hashlib.sha256(data).hexdigest()[:want_hex]
+    digest_size = max(1, min(BLAKE2B_DIGEST_SIZE, (want_hex + 1) // 2))
+    return hashlib.blake2b(data, digest_size=digest_size).hexdigest()[:want_hex]
+
+
+def _truncate_key(key: str, max_length: int) -> str:
+    """Tronca una chiave con hash della parte in eccesso (implementazione di CacheKeyManager.truncate_key)."""
+    if len(key) <= max_length:
+        return key
+        
+    # Per chiavi troppo lunghe, prendiamo l'inizio e un hash della parte rimanente
+    # Questo mantiene leggibilità ma garantisce unicità
+    prefix_length = max_length // 2
+    remaining = key[prefix_length:]
+    
+    # Genera hash della parte rimanente
+    hash_digest = _hex_digest(_key_bytes(remaining), max_length - prefix_length - 1)
+    
+    truncated = f"{key[:prefix_length]}_{hash_digest}"
+    logger.debug(f"Truncated key from {len(key)} chars to {len(truncated)}")
+    
+    return truncated
+
+
+if XXHASH_AVAILABLE:
+    _xxh3_64_intdigest = xxhash.xxh3_64_intdigest
+
+    def _shard_index(truncated: str) -> int:
+        """Restituisce l'indice di shard (0-255) per una chiave troncata."""
+        return _xxh3_64_intdigest(_key_bytes(truncated)) & 0xff
+else:
+    def _shard_index(truncated: str) -> int:
+        """Restituisce l'indice di shard (0-255) per una chiave troncata."""
+        return hashlib.blake2b(_key_bytes(truncated), digest_size=1).digest()[0]
+
+
+def _shard_for(truncated: str) -> str:
+    """Restituisce la sottocartella di shard (2 caratteri esadecimali) per una chiave troncata."""
+    return f"{_shard_index(truncated):02x}"
+
+
+@lru_cache(maxsize=4096)
+def _normalize_and_truncate(key: str, max_length: int) -> str:
+    """
+    Normalizza e tronca una chiave, memorizzando il risultato per la chiave originale.
+    
+    Funzione libera (senza self): la cache è condivisa tra le istanze e non le tiene in vita.
+    """
+    return _truncate_key(_normalize_key(key), max_length)
+
 
 class CacheKeyManager:
     """Gestore chiavi di cache con funzionalità avanzate di ottimizzazione."""
@@ -58,14 +226,132 @@ class CacheKeyManager:
             base_cache_dir: Directory base per la cache su disco
         """
         self.base_cache_dir = base_cache_dir
+        # Bitmap delle sottocartelle di shard già create in questo processo: un byte per
+        # (tipo di cache, shard), 2,5 KB in tutto, esatta e senza falsi positivi
+        self._known_shards = bytearray(len(CACHE_TYPE_DIRS) * SHARDS_PER_TYPE)
         self._init_cache_structure()
     
     def _init_cache_structure(self) -> None:
         """Inizializza la struttura di directory per i diversi tipi di cache."""
+        # Percorsi delle sottocartelle e offset nella bitmap degli shard, calcolati una volta
+        self._subdirs: Dict[str, Tuple[Path, int]] = {}
         for cache_type, dir_name in CACHE_TYPE_DIRS.items():
+            self._subdirs[cache_type] = (self.base_cache_dir / dir_name,
+                                         _CACHE_TYPE_INDEX[cache_type] * SHARDS_PER_TYPE)
+        self._default_subdir = self._subdirs['default']
+        
+        # Le cartelle sono indipendenti: crearle in parallelo riduce l'attesa sui
+        # filesystem ad alta latenza (NFS, FUSE) dove ogni mkdir è un round-trip
+        self.base_cache_dir.mkdir(parents=True, exist_ok=True)
+        cache_dirs = [cache_dir for cache_dir, _ in self._subdirs.values()]
+        with ThreadPoolExecutor(max_workers=min(8, len(cache_dirs))) as executor:
+            list(executor.map(lambda d: d.mkdir(parents=True, exist_ok=True), cache_dirs))
+        logger.debug(f"Initialized {len(cache_dirs)} cache directories under {self.base_cache_dir}")
+        
+        # Porta una cache creata con uno schema di sharding o un formato diverso su quelli correnti
+        layout_path = self.base_cache_dir / LAYOUT_FILE
+        try:
+            with open(layout_path, 'r', encoding='utf-8') as f:
+                layout = json.load(f)
+        except (OSError, ValueError):
+            layout = {}
+        
+        scheme = layout.get('shard_scheme')
+        compression = layout.get('compression', 'gzip')
+        if scheme != SHARD_SCHEME:
+            self.migrate_shard_layout()
+        if compression != CACHE_COMPRESSION and ZSTD_AVAILABLE:
+            self.migrate_compression()
+        if scheme != SHARD_SCHEME or compression != CACHE_COMPRESSION:
+            with open(layout_path, 'w', encoding='utf-8') as f:
+                json.dump({'shard_scheme': SHARD_SCHEME, 'shards': 256,
+                           'compression': CACHE_COMPRESSION}, f)
+    
+    def migrate_shard_layout(self) -> int:
+        """
+        Sposta i file di cache nelle sottocartelle previste dallo schema di sharding corrente.
+        
+        Returns:
+            Numero di file spostati
+        """
+        moved = 0
+        for dir_name in CACHE_TYPE_DIRS.values():
             cache_dir = self.base_cache_dir / dir_name
-            cache_dir.mkdir(parents=True, exist_ok=True)
-            logger.debug(f"Initialized cache directory for {cache_type}: {cache_dir}")
+            if not cache_dir.is_dir():
+                continue
+            
+            for shard_dir in list(cache_dir.iterdir()):
+                if not shard_dir.is_dir():
+                    continue
+                
+                for path in list(shard_dir.iterdir()):
+                    suffix = next((sfx for sfx in CACHE_FILE_SUFFIXES if path.name.endswith(sfx)), None)
+                    if suffix is None:
+                        continue
+                    
+                    target_dir = cache_dir / _shard_for(path.name[:-len(suffix)])
+                    if target_dir == shard_dir:
+                        continue
+                    target_dir.mkdir(exist_ok=True)
+                    os.replace(path, target_dir / path.name)
+                    moved += 1
+                
+                # Rimuovi le vecchie sottocartelle rimaste vuote
+                try:
+                    shard_dir.rmdir()
+                except OSError:
+                    pass
+        
+        if moved:
+            logger.info(f"Migrated {moved} cache files to shard scheme {SHARD_SCHEME}")
+        return moved
+    
+    def migrate_compression(self) -> int:
+        """
+        Ricomprime in zstd i file di cache .cache.gz, conservandone la data di modifica (TTL).
+        
+        Returns:
+            Numero di file convertiti
+        """
+        converted = 0
+        pending = [self.base_cache_dir]
+        while pending:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                        continue
+                    if not entry.name.endswith('.cache.gz'):
+                        continue
+                    
+                    path = Path(entry.path)
+                    target = path.with_name(entry.name[:-len('.cache.gz')] + '.cache.zst')
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                        data = read_cache_file(path)
+                    except (EOFError, zlib.error, gzip.BadGzipFile, zstandard.ZstdError) as e:
+                        # File corrotto: è solo cache, quindi si elimina invece di riprovare a ogni avvio
+                        logger.warning(f"Removing corrupt cache file {path}: {e}")
+                        try:
+                            path.unlink()
+                        except OSError:
+                            pass
+                        continue
+                    except OSError as e:
+                        logger.warning(f"Failed to read cache file {path}: {e}")
+                        continue
+                    
+                    try:
+                        write_cache_file(target, data)
+                        os.utime(target, ns=(st.st_atime_ns, st.st_mtime_ns))
+                        path.unlink()
+                        converted += 1
+                    except (OSError, zstandard.ZstdError) as e:
+                        logger.warning(f"Failed to convert cache file {path}: {e}")
+        
+        if converted:
+            logger.info(f"Recompressed {converted} cache files with zstd")
+        return converted
     
     def normalize_key(self, key: str) -> str:
         """
@@ -77,23 +363,7 @@ class CacheKeyManager:
         Returns:
             Chiave normalizzata
         """
-        # Conversione a lowercase e trim
-        normalized = key.lower().strip()
-        
-        # Rimozione caratteri non validi
-        normalized = INVALID_CHARS_PATTERN.sub('_', normalized)
-        
-        # Sostituzione whitespace con underscore singolo
-        normalized = WHITESPACE_PATTERN.sub('_', normalized)
-        
-        # Rimozione underscore ripetuti
-        normalized = REPEAT_SEPARATORS.sub('_', normalized)
-        
-        # Rimozione leading/trailing underscore
-        normalized = normalized.strip('_')
-        
-        logger.debug(f"Normalized key from '{key}' to '{normalized}'")
-        return normalized
+        return _normalize_key(key)
     
     def truncate_key(self, key: str, max_length: int = MAX_KEY_LENGTH) -> str:
         """
@@ -109,23 +379,7 @@ class CacheKeyManager:
         Returns:
             Chiave troncata con hash
         """
-        if len(key) <= max_length:
-            return key
-            
-        # Per chiavi troppo lunghe, prendiamo l'inizio e un hash della parte rimanente
-        # Questo mantiene leggibilità ma garantisce unicità
-        prefix_length = max_length // 2
-        remaining = key[prefix_length:]
-        
-        # Genera hash della parte rimanente
-        hash_obj = hashlib.new(HASH_ALGORITHM)
-        hash_obj.update(remaining.encode('utf-8'))
-        hash_digest = hash_obj.hexdigest()[:max_length - prefix_length - 1]
-        
-        truncated = f"{key[:prefix_length]}_{hash_digest}"
-        logger.debug(f"Truncated key from {len(key)} chars to {len(truncated)}")
-        
-        return truncated
+        return _truncate_key(key, max_length)
     
     def get_cache_path(self, key: str, cache_type: str = "default") -> Path:
         """
@@ -138,22 +392,23 @@ class CacheKeyManager:
         Returns:
             Path al file di cache
         """
-        # Normalizza e tronca la chiave
-        normalized = self.normalize_key(key)
-        truncated = self.truncate_key(normalized)
+        # Normalizza e tronca la chiave (risultato in cache per le chiavi ripetute)
+        truncated = _normalize_and_truncate(key, MAX_KEY_LENGTH)
         
         # Determina sottodirectory appropriata
-        subdir_name = CACHE_TYPE_DIRS.get(cache_type, CACHE_TYPE_DIRS['default'])
-        cache_subdir = self.base_cache_dir / subdir_name
+        cache_subdir, slot_offset = self._subdirs.get(cache_type, self._default_subdir)
         
-        # Ulteriore organizzazione in sottocartelle basata su prefisso per evitare
-        # troppe cartelle nello stesso livello (sharding)
-        prefix = truncated[:2] if len(truncated) >= 2 else 'aa'
-        sharded_dir = cache_subdir / prefix
-        sharded_dir.mkdir(exist_ok=True)
+        # Ulteriore organizzazione in sottocartelle basata sull'hash della chiave per evitare
+        # troppi file nella stessa cartella (sharding uniforme su 256 sottocartelle)
+        shard = _shard_index(truncated)
+        sharded_dir = cache_subdir / f"{shard:02x}"
+        slot = slot_offset + shard
+        if not self._known_shards[slot]:
+            sharded_dir.mkdir(parents=True, exist_ok=True)
+            self._known_shards[slot] = 1
         
         # Genera il percorso completo
-        return sharded_dir / f"{truncated}.cache.gz"
+        return sharded_dir / f"{truncated}{CACHE_FILE_EXTENSION}"
     
     def compose_key(self, *parts, prefix: str = None) -> str:
         """
@@ -206,8 +461,7 @@ class CacheKeyManager:
         params_part = "_".join(key_params) if key_params else ""
         
         # Normalizza e tronca la query (spesso molto lunga)
-        query_normalized = self.normalize_key(query)
-        query_truncated = self.truncate_key(query_normalized, MAX_KEY_LENGTH // 2)
+        query_truncated = _normalize_and_truncate(query, MAX_KEY_LENGTH // 2)
         
         return self.compose_key(model_part, params_part, query_truncated)
     
@@ -232,16 +486,12 @@ class CacheKeyManager:
         """
         stats = {}
         
-        for cache_type, dir_name in CACHE_TYPE_DIRS.items():
-            cache_dir = self.base_cache_dir / dir_name
+        for cache_type, (cache_dir, _) in self._subdirs.items():
             if not cache_dir.exists():
                 continue
                 
-            # Conta i file per questo tipo
-            count = sum(1 for _ in cache_dir.glob('**/*.cache.gz'))
-            
-            # Calcola dimensione totale
-            size = sum(f.stat().st_size for f in cache_dir.glob('**/*.cache.gz') if f.is_file())
+            # Conta i file e calcola la dimensione totale in un'unica visita
+            count, size = _scan_cache_files(cache_dir)
             
             stats[cache_type] = {
                 'count': count,
@@ -252,6 +502,71 @@ class CacheKeyManager:
         return stats
 
 
+def _scan_cache_files(directory: Path) -> Tuple[int, int]:
+    """
+    Conta i file di cache (.cache.zst e .cache.gz) sotto una directory e ne somma le dimensioni con os.scandir.
+    
+    Args:
+        directory: Directory da visitare ricorsivamente
+        
+    Returns:
+        Tupla (numero di file, dimensione totale in byte)
+    """
+    count = 0
+    size = 0
+    pending = [directory]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.name.endswith(CACHE_DATA_SUFFIXES) and entry.is_file(follow_symlinks=False):
+                    count += 1
+                    size += entry.stat(follow_symlinks=False).st_size
+    return count, size
+
+
+def read_cache_file(path: Path) -> bytes:
+    """
+    Legge e decomprime un file di cache, riconoscendo il codec dal magic number.
+    
+    Args:
+        path: File .cache.zst o .cache.gz
+        
+    Returns:
+        Contenuto decompresso (o il contenuto grezzo se il file non è compresso)
+    """
+    data = path.read_bytes()
+    if data.startswith(ZSTD_MAGIC):
+        return zstandard.ZstdDecompressor().decompress(data)
+    if data.startswith(GZIP_MAGIC):
+        return gzip.decompress(data)
+    return data
+
+
+def write_cache_file(path: Path, data: bytes, gzip_level: int = 6, max_compression: bool = False,
+                     compress: bool = True) -> None:
+    """
+    Comprime e scrive un file di cache, scegliendo il codec dal suffisso.
+    
+    Args:
+        path: File .cache.zst o .cache.gz
+        data: Contenuto da scrivere
+        gzip_level: Livello di compressione per i file gzip (0-9)
+        max_compression: Usa il livello massimo del codec (più lento, file più piccoli)
+        compress: Se False scrive i dati senza compressione (utile per payload piccoli)
+    """
+    if not compress:
+        payload = data
+    elif path.name.endswith('.cache.zst'):
+        level = ZSTD_MAX_LEVEL if max_compression else ZSTD_LEVEL
+        # Un compressore per chiamata: le istanze zstd non vanno condivise tra thread
+        payload = zstandard.ZstdCompressor(level=level).compress(data)
+    else:
+        payload = gzip.compress(data, compresslevel=GZIP_MAX_LEVEL if max_compression else gzip_level)
+    path.write_bytes(payload)
+
+
 def get_query_hash(query: str) -> str:
     """
     Genera un hash deterministico per una query.
@@ -263,9 +578,7 @@ def get_query_hash(query: str) -> str:
     Returns:
         Hash della query in formato esadecimale
     """
-    hash_obj = hashlib.new(HASH_ALGORITHM)
-    hash_obj.update(query.encode('utf-8'))
-    return hash_obj.hexdigest()
+    return _fast_hash(query.encode('utf-8')).hexdigest()
 
 
 def sanitize_filename(name: str) -> str:
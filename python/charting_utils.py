@@ -1,8 +1,16 @@
+import time
 import yfinance as yf
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
 
+# Try importing requests_cache for a persistent HTTP cache shared by all tickers
+try:
+    import requests_cache
+    REQUESTS_CACHE_AVAILABLE = True
+except ImportError:
+    REQUESTS_CACHE_AVAILABLE = False
+
 # Dizionario di mapping per i simboli delle commodity più comuni su Yahoo Finance
 # Questo potrebbe aver bisogno di aggiustamenti a seconda della fonte esatta e del formato dei simboli
 COMMODITY_SYMBOLS_YFINANCE = {
@@ -17,6 +25,51 @@ COMMODITY_SYMBOLS_YFINANCE = {
     # Aggiungi altri simboli se necessario
 }
 
+# Oggetti Ticker riutilizzati tra le chiamate (evita di ricreare sessione e cookie)
+_TICKER_CACHE = {}
+
+# Sessione HTTP con cache su disco (SQLite), allineata alla cadenza delle barre giornaliere
+YF_HTTP_CACHE_SECONDS = 3600
+_YF_SESSION = (requests_cache.CachedSession('.yf_cache', expire_after=YF_HTTP_CACHE_SECONDS)
+               if REQUESTS_CACHE_AVAILABLE else None)
+
+# Cache in memoria dei DataFrame: (simbolo, periodo, intervallo) -> {"timestamp", "data"}
+DATA_CACHE = {}
+DATA_CACHE_TTL = {"default": 60, "1d": 3600, "5d": 3600, "1wk": 3600, "1mo": 3600, "3mo": 3600}
+
+# Impostazioni di layout comuni a tutti i grafici, definite una sola volta
+_BASE_LAYOUT = dict(
+    xaxis_title="Data",
+    yaxis_title="Prezzo",
+    xaxis_rangeslider_visible=False,
+    legend_title_text="Legenda",
+    template="plotly_white",
+)
+
+def _get_ticker(yf_symbol: str) -> yf.Ticker:
+    """Restituisce (creandolo una sola volta) l'oggetto Ticker per un simbolo Yahoo Finance."""
+    ticker = _TICKER_CACHE.get(yf_symbol)
+    if ticker is None:
+        try:
+            if _YF_SESSION is not None:
+                ticker = yf.Ticker(yf_symbol, session=_YF_SESSION)
+            else:
+                ticker = yf.Ticker(yf_symbol)
+        except Exception:
+            # Le versioni recenti di yfinance accettano solo la propria sessione
+            ticker = yf.Ticker(yf_symbol)
+        _TICKER_CACHE[yf_symbol] = ticker
+    return ticker
+
+def _to_ohlcv(data: pd.DataFrame) -> pd.DataFrame:
+    """Riduce un DataFrame di yfinance alle colonne OHLCV in minuscolo, con DatetimeIndex."""
+    # Seleziona solo le colonne OHLCV e rinominale sul sottoinsieme (nessuna copia dell'intero frame)
+    data = data[['Open', 'High', 'Low', 'Close', 'Volume']]
+    data.columns = ['open', 'high', 'low', 'close', 'volume']
+    # Garantisce ai chiamanti un DatetimeIndex (plot_candlestick_chart può saltare il controllo)
+    data.index = pd.DatetimeIndex(data.index, copy=False)
+    return data
+
 def get_commodity_data(symbol: str, period: str = "1y", interval: str = "1d") -> pd.DataFrame:
     """Scarica i dati storici per una commodity da Yahoo Finance.
 
@@ -27,7 +80,14 @@ def get_commodity_data(symbol: str, period: str = "1y", interval: str = "1d") ->
 
     Returns:
         pd.DataFrame: DataFrame con i dati OHLCV, o None se il simbolo non è valido o si verifica un errore.
+                      Il DataFrame può essere condiviso con altre chiamate: non modificarlo sul posto.
     """
+    cache_key = (symbol.upper(), period, interval)
+    cached = DATA_CACHE.get(cache_key)
+    ttl = DATA_CACHE_TTL.get(interval, DATA_CACHE_TTL["default"])
+    if cached and time.time() - cached["timestamp"] < ttl:
+        return cached["data"]
+
     yf_symbol = COMMODITY_SYMBOLS_YFINANCE.get(symbol.upper())
     if not yf_symbol:
         print(f"Simbolo {symbol} non mappato per Yahoo Finance. Controlla COMMODITY_SYMBOLS_YFINANCE.")
@@ -36,60 +96,125 @@ def get_commodity_data(symbol: str, period: str = "1y", interval: str = "1d") ->
         # Considera di aggiungere qui un avviso o un log se il simbolo non è nel mapping predefinito
 
     try:
-        ticker = yf.Ticker(yf_symbol)
+        ticker = _get_ticker(yf_symbol)
         data = ticker.history(period=period, interval=interval)
         if data.empty:
             print(f"Nessun dato trovato per il simbolo {yf_symbol} ({symbol}) con periodo {period} e intervallo {interval}.")
             return None
-        # Rinomina le colonne per coerenza se necessario (yfinance di solito le ha già corrette)
-        data.rename(columns={
-            "Open": "open", "High": "high", "Low": "low", "Close": "close", "Volume": "volume"
-        }, inplace=True)
-        return data[['open', 'high', 'low', 'close', 'volume']]
+        data = _to_ohlcv(data)
+        DATA_CACHE[cache_key] = {"timestamp": time.time(), "data": data}
+        return data
     except Exception as e:
         print(f"Errore durante il download dei dati per {yf_symbol} ({symbol}): {e}")
         return None
 
-def plot_candlestick_chart(df: pd.DataFrame, symbol_display: str = "Commodity") -> go.Figure:
+def get_commodity_data_many(symbols: list, period: str = "1y", interval: str = "1d") -> dict:
+    """Scarica i dati storici di più commodity con un'unica chiamata a yf.download.
+
+    yfinance esegue le richieste HTTP in parallelo, quindi il tempo totale è vicino a quello
+    della richiesta più lenta invece che alla somma. I simboli già presenti in cache non
+    vengono riscaricati.
+
+    Args:
+        symbols (list): Simboli delle commodity (es. ["XAUUSD", "WTICOUSD"]).
+        period (str, optional): Il periodo per cui scaricare i dati. Default "1y".
+        interval (str, optional): L'intervallo dei dati. Default "1d".
+
+    Returns:
+        dict: Simbolo -> DataFrame OHLCV (None per i simboli senza dati).
+    """
+    ttl = DATA_CACHE_TTL.get(interval, DATA_CACHE_TTL["default"])
+    now = time.time()
+    results = {}
+    to_download = {}
+    for symbol in symbols:
+        cached = DATA_CACHE.get((symbol.upper(), period, interval))
+        if cached and now - cached["timestamp"] < ttl:
+            results[symbol] = cached["data"]
+        else:
+            to_download[symbol] = COMMODITY_SYMBOLS_YFINANCE.get(symbol.upper(), symbol.upper())
+
+    if not to_download:
+        return results
+
+    yf_symbols = list(dict.fromkeys(to_download.values()))
+    try:
+        raw = yf.download(yf_symbols, period=period, interval=interval,
+                          group_by='ticker', threads=True, progress=False)
+    except Exception as e:
+        print(f"Errore durante il download dei dati per {', '.join(yf_symbols)}: {e}")
+        raw = None
+
+    for symbol, yf_symbol in to_download.items():
+        data = None
+        if raw is not None and yf_symbol in raw.columns.get_level_values(0):
+            data = raw[yf_symbol].dropna(how='all')
+        if data is None or data.empty:
+            print(f"Nessun dato trovato per il simbolo {yf_symbol} ({symbol}) con periodo {period} e intervallo {interval}.")
+            results[symbol] = None
+            continue
+        data = _to_ohlcv(data)
+        DATA_CACHE[(symbol.upper(), period, interval)] = {"timestamp": now, "data": data}
+        results[symbol] = data
+
+    return results
+
+def plot_candlestick_chart(df: pd.DataFrame, symbol_display: str = "Commodity",
+                           assume_datetime_index: bool = True, with_volume: bool = True,
+                           rangeslider: bool = False) -> go.Figure:
     """Genera un grafico a candele interattivo con Plotly.
 
     Args:
         df (pd.DataFrame): DataFrame con i dati OHLCV (colonne 'open', 'high', 'low', 'close', 'volume').
                            L'indice deve essere di tipo Datetime.
         symbol_display (str, optional): Nome del simbolo da visualizzare nel titolo del grafico. Default "Commodity".
+        assume_datetime_index (bool, optional): Se True (default) l'indice è già un DatetimeIndex, come quello
+                           restituito da get_commodity_data, e non viene controllato. Passare False per
+                           DataFrame di altra provenienza.
+        with_volume (bool, optional): Se False crea una figura semplice con le sole candele, senza subplot
+                           del volume (più leggera da costruire e da serializzare). Default True.
+        rangeslider (bool, optional): Mostra il range slider sotto il grafico dei prezzi. Default False.
 
     Returns:
         go.Figure: Oggetto figura di Plotly.
     """
-    if not isinstance(df.index, pd.DatetimeIndex):
+    if not assume_datetime_index and not isinstance(df.index, pd.DatetimeIndex):
         try:
-            df.index = pd.to_datetime(df.index)
+            df.index = pd.DatetimeIndex(df.index, copy=False)
         except Exception as e:
             raise ValueError(f"L'indice del DataFrame deve essere convertibile in DatetimeIndex. Errore: {e}")
 
+    # Array NumPy sottostanti: Plotly non deve riconvertire Series e indice
+    dates = df.index.to_numpy()
+
+    candlestick = go.Candlestick(x=dates,
+                                 open=df['open'].to_numpy(),
+                                 high=df['high'].to_numpy(),
+                                 low=df['low'].to_numpy(),
+                                 close=df['close'].to_numpy(),
+                                 name="OHLC")
+
+    if not with_volume:
+        # Figura singola: nessun costo di make_subplots e layout più piccolo
+        layout = {**_BASE_LAYOUT, 'title_text': f"{symbol_display} Prezzo"}
+        if rangeslider:
+            layout['xaxis_rangeslider_visible'] = True
+        return go.Figure(candlestick, layout=layout)
+
     fig = make_subplots(rows=2, cols=1, shared_xaxes=True, 
                         vertical_spacing=0.05, subplot_titles=(f'{symbol_display} Candlestick', 'Volume'),
                         row_width=[0.2, 0.7])
 
     # Grafico a candele
-    fig.add_trace(go.Candlestick(x=df.index,
-                               open=df['open'],
-                               high=df['high'],
-                               low=df['low'],
-                               close=df['close'],
-                               name="OHLC"), row=1, col=1)
+    fig.add_trace(candlestick, row=1, col=1)
 
     # Grafico del volume
-    fig.add_trace(go.Bar(x=df.index, y=df['volume'], name="Volume", marker_color='rgba(0,0,100,0.6)'), row=2, col=1)
-
-    fig.update_layout(
-        title_text=f"{symbol_display} Prezzo e Volume",
-        xaxis_title="Data",
-        yaxis_title="Prezzo",
-        xaxis_rangeslider_visible=False, # Nasconde il range slider di default sotto il grafico principale
-        legend_title_text="Legenda",
-        template="plotly_white"
-    )
+    fig.add_trace(go.Bar(x=dates, y=df['volume'].to_numpy(), name="Volume", marker_color='rgba(0,0,100,0.6)'), row=2, col=1)
+
+    layout = {**_BASE_LAYOUT, 'title_text': f"{symbol_display} Prezzo e Volume"}
+    if rangeslider:
+        layout['xaxis_rangeslider_visible'] = True # Range slider sotto il grafico principale
+    fig.update_layout(**layout)
     
     fig.update_yaxes(title_text="Volume", row=2, col=1)
 
@@ -99,10 +224,12 @@ if __name__ == '__main__':
     # Esempio di utilizzo
     print("Esempio di utilizzo di charting_utils:")
     
-    # Scarica dati per l'oro (XAUUSD)
+    # Scarica in un'unica richiesta i dati per l'oro (XAUUSD) e il petrolio (WTICOUSD)
     gold_symbol = "XAUUSD"
-    print(f"\nRecupero dati per {gold_symbol}...")
-    gold_data = get_commodity_data(gold_symbol, period="6mo", interval="1d")
+    oil_symbol = "WTICOUSD"
+    print(f"\nRecupero dati per {gold_symbol} e {oil_symbol}...")
+    all_data = get_commodity_data_many([gold_symbol, oil_symbol], period="6mo", interval="1d")
+    gold_data = all_data[gold_symbol]
     
     if gold_data is not None and not gold_data.empty:
         print(f"Dati per {gold_symbol} recuperati:")
@@ -122,10 +249,8 @@ if __name__ == '__main__':
     else:
         print(f"Non è stato possibile recuperare o graficare i dati per {gold_symbol}.")
 
-    # Esempio per una commodity che potrebbe non essere nel mapping diretto o fallire
-    oil_symbol = "WTICOUSD"
-    print(f"\nRecupero dati per {oil_symbol}...")
-    oil_data = get_commodity_data(oil_symbol, period="3mo")
+    # Secondo simbolo, già scaricato insieme al primo
+    oil_data = all_data[oil_symbol]
     if oil_data is not None and not oil_data.empty:
         print(f"Dati per {oil_symbol} recuperati.")
         fig_oil = plot_candlestick_chart(oil_data, symbol_display=oil_symbol)
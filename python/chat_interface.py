@@ -12,50 +12,51 @@ MIT License
 Copyright (c) 2025 Immaginet Srl
 """
 
+import io
 import os
 import sys
+import re
+import csv
 import json
 import time
+import asyncio
 import logging
 import argparse
+import threading
+import importlib.util
 from pathlib import Path
-from typing import Dict, Any, Optional, List
-import pandas as pd
+from types import MappingProxyType
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional, List, Tuple, TYPE_CHECKING
 from datetime import datetime
 import webbrowser
 import tempfile
-from charting_utils import get_commodity_data, plot_candlestick_chart
 
-# Try importing FastAPI related modules
-try:
-    from fastapi import FastAPI, HTTPException, Request
-    from fastapi.responses import JSONResponse
-    from fastapi.middleware.cors import CORSMiddleware
-    import uvicorn
-    from pydantic import BaseModel
-    
-    FASTAPI_AVAILABLE = True
-except ImportError:
-    FASTAPI_AVAILABLE = False
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
 
-# Try importing rich for CLI prettification
+# Try importing orjson for faster JSON parsing and serialization
 try:
-    from rich.console import Console
-    from rich.panel import Panel
-    from rich.table import Table
-    from rich.markdown import Markdown
-    
-    RICH_AVAILABLE = True
-    console = Console()
+    import orjson
+    ORJSON_AVAILABLE = True
 except ImportError:
-    RICH_AVAILABLE = False
+    ORJSON_AVAILABLE = False
 
-# Try importing DeepSeek utilities
-try:
-    from deepseek_utils import qa, analyze_market_factors, pattern_recognition, portfolio_optimization, scenario_analysis, fetch_commodity_news
-    DEEPSEEK_AVAILABLE = True
-except ImportError:
-    DEEPSEEK_AVAILABLE = False
+# Heavy optional dependencies are only probed here and imported on first use
+# (see _build_app, _get_console, _get_deepseek), so the CLI starts without loading
+# pandas, FastAPI/uvicorn, rich or the models unless a command needs them
+FASTAPI_AVAILABLE = all(importlib.util.find_spec(m) is not None for m in ("fastapi", "uvicorn", "pydantic"))
+UVLOOP_AVAILABLE = importlib.util.find_spec("uvloop") is not None  # Faster event loop (not on Windows)
+HTTPTOOLS_AVAILABLE = importlib.util.find_spec("httptools") is not None  # Faster HTTP parser
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None  # Multithreaded CSV reader
+RICH_AVAILABLE = importlib.util.find_spec("rich") is not None  # CLI prettification
+# Semantic tier of the answer cache
+SENTENCE_TRANSFORMERS_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+# DeepSeek utilities (pulls in requests, pandas and the disk cache)
+DEEPSEEK_AVAILABLE = importlib.util.find_spec("deepseek_utils") is not None
 
 # Configure logging
 logging.basicConfig(
@@ -72,7 +73,180 @@ logger = logging.getLogger("chat_interface")
 MT4_FILES_PATH = os.path.expanduser("~/AppData/Roaming/MetaTrader 4/MQL4/Files/OpenMT4TradingBot")
 DATA_PATH = "../data"
 CONTEXT_REFRESH_SECONDS = 60
+CONTEXT_REFRESH_NS = CONTEXT_REFRESH_SECONDS * 1_000_000_000
 CONVERSATION_HISTORY_MAX = 10  # Maximum number of conversation exchanges to keep
+CONVERSATION_CONTEXT_EXCHANGES = 3  # Exchanges included in the QA context
+
+# Answer cache settings
+ANSWER_CACHE_MAX_ITEMS = 256
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", "600"))  # Seconds
+ANSWER_CACHE_SEMANTIC = os.environ.get("ANSWER_CACHE_SEMANTIC", "0") == "1"  # Needs sentence-transformers
+ANSWER_CACHE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+ANSWER_CACHE_SIMILARITY = 0.9  # Minimum cosine similarity for a semantic hit
+# /ask request batching: requests arriving within the delay are answered together
+ASK_BATCH_MAX_SIZE = 8
+ASK_BATCH_MAX_DELAY = 0.05  # Seconds
+# Worker threads for blocking work (DeepSeek calls, file parsing) done by the API endpoints
+API_WORKER_THREADS = int(os.environ.get("CHAT_API_WORKER_THREADS", "32"))
+# Commands whose result must not be reused (inputs change each call, or side effects)
+NO_CACHE_COMMANDS = {"optimize", "scenarios", "chart", "chart_error", "help"}
+# Error answers produced here that should be retried rather than cached
+# (fallbacks from deepseek_utils are recognized as FallbackResponse instead)
+UNCACHEABLE_ANSWER_PREFIXES = (
+    "Sorry, I couldn't answer",
+    "DeepSeek API",
+    "Offline mode",
+    "Si è verificato un errore",
+)
+
+# Supported symbols and their common names, matched by detect_symbol
+SUPPORTED_SYMBOLS = ["XAUUSD", "XAGUSD", "WTICOUSD", "BCOUSD", "NATGASUSD", "CORNUSD", "SOYBNUSD", "WHEATUSD"]
+SYMBOL_ALIASES = {
+    "gold": "XAUUSD", 
+    "silver": "XAGUSD", 
+    "wti": "WTICOUSD", 
+    "crude": "WTICOUSD",
+    "oil": "WTICOUSD", 
+    "brent": "BCOUSD",
+    "natural gas": "NATGASUSD", 
+    "natgas": "NATGASUSD",
+    "corn": "CORNUSD", 
+    "soybean": "SOYBNUSD", 
+    "soybeans": "SOYBNUSD", 
+    "wheat": "WHEATUSD"
+}
+_ALIAS_TO_SYMBOL = {**{symbol.lower(): symbol for symbol in SUPPORTED_SYMBOLS}, **SYMBOL_ALIASES}
+# One alternation over symbols and aliases (longest first), scanned once per question
+SYMBOL_RE = re.compile(
+    r'\b(' + '|'.join(re.escape(name) for name in sorted(_ALIAS_TO_SYMBOL, key=len, reverse=True)) + r')\b',
+    re.IGNORECASE
+)
+
+# Command names (Italian and English) -> canonical command
+COMMAND_ALIASES = {
+    "analizza": "analyze", "analyze": "analyze",
+    "pattern": "patterns", "patterns": "patterns",
+    "rischio": "risk", "risk": "risk",
+    "ottimizza": "optimize", "optimize": "optimize",
+    "correlazioni": "correlations", "correlations": "correlations",
+    "news": "news", "notizie": "news",
+    "scenario": "scenarios", "scenarios": "scenarios",
+    "help": "help", "aiuto": "help",
+    "chart": "chart", "grafico": "chart",
+}
+# Commands taking an optional symbol argument (defaults to the symbol being discussed)
+SYMBOL_COMMANDS = {"analyze", "patterns", "news"}
+
+# Explicit dtypes for cot.csv (covers both the sample layout and the one written by
+# signal_engine), so pandas doesn't have to infer them. Every column is still loaded
+# because the records are passed verbatim to the model as context.
+COT_DTYPES = {
+    'Date': 'str',
+    'Symbol': 'category',
+    'COT_Symbol': 'category',
+    'LongCommercial': 'int32',
+    'ShortCommercial': 'int32',
+    'LongNonCommercial': 'int32',
+    'ShortNonCommercial': 'int32',
+    'LongSmall': 'int32',
+    'ShortSmall': 'int32',
+    'Commercial_Net': 'float64',
+    'Commercial_Net_Normalized': 'float64',
+}
+
+
+_deepseek_utils = None
+_console = None
+_app = None
+
+
+def _get_deepseek():
+    """Import deepseek_utils on first use (None if its dependencies are missing)."""
+    global _deepseek_utils, DEEPSEEK_AVAILABLE
+    if _deepseek_utils is None and DEEPSEEK_AVAILABLE:
+        try:
+            import deepseek_utils
+            _deepseek_utils = deepseek_utils
+        except ImportError as e:
+            logger.error(f"DeepSeek utilities unavailable: {e}")
+            DEEPSEEK_AVAILABLE = False
+    return _deepseek_utils
+
+
+def _get_console():
+    """Create the rich console on first use."""
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
+
+
+def _json_loads(data: bytes) -> Any:
+    """Parse JSON bytes, using orjson if available."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_pretty(obj: Any) -> str:
+    """Serialize an object as indented JSON text, using orjson if available."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode('utf-8')
+    return json.dumps(obj, indent=2)
+
+
+def _read_cot_csv(data: bytes) -> "pd.DataFrame":
+    """
+    Parse the contents of cot.csv with explicit dtypes, using the pyarrow engine when available.
+    
+    Args:
+        data: Raw bytes of the COT CSV file
+        
+    Returns:
+        DataFrame with the COT records
+    """
+    # Only pass dtypes for the columns this file actually has
+    header_line = data.split(b"\n", 1)[0].decode('utf-8-sig')
+    header = next(csv.reader([header_line]), [])
+    dtype = {col: COT_DTYPES[col] for col in header if col in COT_DTYPES}
+    
+    import pandas as pd
+    
+    if PYARROW_AVAILABLE:
+        return pd.read_csv(io.BytesIO(data), dtype=dtype, engine='pyarrow')
+    return pd.read_csv(io.BytesIO(data), dtype=dtype)
+
+
+_file_read_executor = None
+
+
+def _read_files(paths: List[Path]) -> List[Any]:
+    """
+    Read several files as bytes, concurrently when there is more than one.
+    
+    On network shares (where MT4 usually lives) each read is latency-bound,
+    so overlapping them shortens a refresh that finds several changed files.
+    
+    Args:
+        paths: Files to read
+        
+    Returns:
+        list: Bytes of each file, or the exception raised while reading it
+    """
+    def read(path: Path) -> Any:
+        try:
+            return path.read_bytes()
+        except OSError as e:
+            return e
+    
+    if len(paths) <= 1:
+        return [read(path) for path in paths]
+    
+    global _file_read_executor
+    if _file_read_executor is None:
+        _file_read_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="context-io")
+    return list(_file_read_executor.map(read, paths))
 
 
 class Context:
@@ -88,47 +262,114 @@ class Context:
         """
         self.mt4_path = Path(mt4_path)
         self.data_path = Path(data_path)
-        self.last_update = 0
-        self.context = {}
-        self.refresh()
+        self.last_update = None  # time.monotonic_ns() of the last refresh
+        # Read-only snapshot, replaced as a whole by refresh() so readers never need a lock
+        self.context = MappingProxyType({})
+        self._mtimes = {}  # Context key -> st_mtime_ns of the file it was loaded from
+        # Incremented whenever a source file is (re)loaded; starts from the clock so versions
+        # from an earlier process never match (qa persists its cache keys on disk)
+        self.version = time.time_ns()
+        self._refresh_lock = threading.Lock()
+        self._background = False  # True while a background task/thread keeps the context fresh
+        # Files are loaded on the first get(), not at construction (keeps imports cheap)
+    
+    def _changed(self, key: str, path: Path) -> Optional[int]:
+        """
+        Check whether a source file changed since it was last loaded.
+        
+        Args:
+            key: Context key the file is loaded into
+            path: Path to the source file
+            
+        Returns:
+            The file's st_mtime_ns if it exists and must be (re)loaded, None otherwise.
+            The caller records it only once the file has loaded successfully.
+        """
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            return None
+        if self._mtimes.get(key) == mtime and key in self.context:
+            return None
+        return mtime
         
-    def refresh(self) -> bool:
-        """Refresh the context data from files."""
-        current_time = time.time()
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Refresh the context data from files.
+        
+        Args:
+            force: Refresh even if CONTEXT_REFRESH_SECONDS have not passed yet
+            
+        Returns:
+            True if the context was refreshed, False otherwise
+        """
+        # Monotonic clock: immune to wall-clock jumps (NTP, DST)
+        current_time = time.monotonic_ns()
         
         # Only refresh if enough time has passed
-        if current_time - self.last_update < CONTEXT_REFRESH_SECONDS:
+        if not force and self.last_update is not None and current_time - self.last_update < CONTEXT_REFRESH_NS:
             return False
-            
+        
+        with self._refresh_lock:
+            return self._refresh_sync(current_time)
+    
+    def _refresh_sync(self, current_time: int) -> bool:
+        """Reload the changed files into a new snapshot and swap it in (caller holds the lock)."""
         try:
-            # Load signals
-            signal_file = self.mt4_path / "signal.json"
-            if signal_file.exists():
-                with open(signal_file, 'r') as f:
-                    self.context['signals'] = json.load(f)
+            context = dict(self.context)
             
-            # Load positions
-            positions_file = self.mt4_path / "positions.json"
-            if positions_file.exists():
-                with open(positions_file, 'r') as f:
-                    self.context['positions'] = json.load(f)
+            # Stat every source, then read only the changed ones (concurrently)
+            sources = {
+                'signals': self.mt4_path / "signal.json",
+                'positions': self.mt4_path / "positions.json",
+                'cot': self.data_path / "cot.csv",
+            }
+            # New mtimes are staged and stored only for sources that load successfully,
+            # so a file caught mid-write is read again on the next refresh
+            staged = {}
+            for key, path in sources.items():
+                mtime = self._changed(key, path)
+                if mtime is not None:
+                    staged[key] = mtime
+            changed = list(staged)
+            raw = dict(zip(changed, _read_files([sources[key] for key in changed])))
             
-            # Load COT data
-            cot_file = self.data_path / "cot.csv"
-            if cot_file.exists():
+            # Load signals and positions
+            for key in ('signals', 'positions'):
+                if key in raw:
+                    if isinstance(raw[key], Exception):
+                        raise raw[key]
+                    context[key] = _json_loads(raw[key])
+            
+            # Load COT data (parsed only when the file changed)
+            if 'cot' in raw:
                 try:
-                    cot_df = pd.read_csv(cot_file)
-                    # Get last 4 rows for each symbol
-                    self.context['cot'] = {}
-                    for symbol in cot_df['Symbol'].unique():
-                        symbol_df = cot_df[cot_df['Symbol'] == symbol].tail(4)
-                        self.context['cot'][symbol] = symbol_df.to_dict('records')
+                    if isinstance(raw['cot'], Exception):
+                        raise raw['cot']
+                    cot_df = _read_cot_csv(raw['cot'])
+                    # Get last 4 rows for each symbol in a single grouped pass
+                    tail_df = cot_df.groupby('Symbol', sort=False, observed=True).tail(4)
+                    context['cot'] = {
+                        symbol: symbol_df.to_dict('records')
+                        for symbol, symbol_df in tail_df.groupby('Symbol', sort=False, observed=True)
+                    }
                 except Exception as e:
+                    # Retry on the next refresh instead of caching the failure
+                    del staged['cot']
                     logger.error(f"Error loading COT data: {e}")
             
             # Load news (placeholder - would come from a news API in production)
-            self.context['news'] = []
+            context['news'] = []
+            
+            # Atomic swap: readers see either the old or the new snapshot
+            self.context = MappingProxyType(context)
             
+            # Every source loaded: record what was read and bump the version. The version
+            # changes after the snapshot, so a reader that takes the version first never
+            # pairs a newer version with older data
+            if staged:
+                self._mtimes.update(staged)
+                self.version += 1
             self.last_update = current_time
             logger.info("Context refreshed")
             return True
@@ -137,10 +378,168 @@ class Context:
             logger.error(f"Error refreshing context: {e}")
             return False
     
-    def get(self) -> Dict:
-        """Get the current context."""
-        self.refresh()
+    def get(self) -> MappingProxyType:
+        """Get the current context (read-only snapshot)."""
+        if not self._background:
+            self.refresh()
         return self.context
+    
+    async def refresh_loop(self) -> None:
+        """Refresh the context every CONTEXT_REFRESH_SECONDS in a worker thread (run as an asyncio task)."""
+        self._background = True
+        try:
+            while True:
+                await asyncio.to_thread(self.refresh, True)
+                await asyncio.sleep(CONTEXT_REFRESH_SECONDS)
+        finally:
+            self._background = False
+    
+    def start_refresh_thread(self) -> None:
+        """Refresh the context every CONTEXT_REFRESH_SECONDS in a daemon thread (CLI mode)."""
+        def loop():
+            while True:
+                time.sleep(CONTEXT_REFRESH_SECONDS)
+                self.refresh(force=True)
+        
+        self.refresh(force=True)
+        self._background = True
+        threading.Thread(target=loop, name="context-refresh", daemon=True).start()
+
+
+class AnswerCache:
+    """Two-tier cache of answers: exact question match, then (optionally) semantic similarity."""
+    
+    def __init__(self, max_items: int = ANSWER_CACHE_MAX_ITEMS, ttl: int = ANSWER_CACHE_TTL,
+                 semantic: bool = ANSWER_CACHE_SEMANTIC):
+        """
+        Initialize the answer cache.
+        
+        Args:
+            max_items: Maximum number of cached answers (least recently used are evicted)
+            ttl: Time to live of a cached answer in seconds
+            semantic: Whether to match near-duplicate questions by embedding similarity
+        """
+        self.max_items = max_items
+        self.ttl = ttl
+        self.semantic = semantic and SENTENCE_TRANSFORMERS_AVAILABLE
+        # (normalized question, context version, symbol) -> (timestamp, symbol, answer).
+        # The symbol (resolved from the conversation when the question doesn't name one)
+        # keeps a follow-up like "what's the outlook?" from reusing another market's answer
+        self._entries: "OrderedDict[Tuple[str, int, Optional[str]], Tuple[float, Optional[str], Dict[str, Any]]]" = OrderedDict()
+        # Semantic tier: exact keys with their normalized embeddings (row i <-> _keys[i])
+        self._keys: List[Tuple[str, int, Optional[str]]] = []
+        self._embeddings: Optional["np.ndarray"] = None
+        self._model = None
+        self._lock = threading.Lock()  # ask_question may run in worker threads
+    
+    @staticmethod
+    def _normalize(question: str) -> str:
+        """Normalize a question for exact matching (case and whitespace)."""
+        return " ".join(question.lower().split())
+    
+    def _embed(self, question: str) -> "np.ndarray":
+        """Compute the normalized embedding of a question, loading the model on first use."""
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(ANSWER_CACHE_MODEL)
+        return self._model.encode(question, normalize_embeddings=True, convert_to_numpy=True)
+    
+    def _prune(self) -> None:
+        """Drop expired entries and enforce the size limit."""
+        cutoff = time.monotonic() - self.ttl
+        removed = False
+        for key in [k for k, (ts, _, _) in self._entries.items() if ts < cutoff]:
+            del self._entries[key]
+            removed = True
+        while len(self._entries) > self.max_items:
+            self._entries.popitem(last=False)
+            removed = True
+        
+        if removed and self._keys:
+            keep = [i for i, key in enumerate(self._keys) if key in self._entries]
+            self._keys = [self._keys[i] for i in keep]
+            self._embeddings = self._embeddings[keep]
+    
+    def get(self, question: str, version: int, symbol: Optional[str] = None,
+            semantic: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached answer.
+        
+        Args:
+            question: User's question
+            version: Context version the answer must have been computed against
+            symbol: Symbol the question is about (semantic hits must match it)
+            semantic: Whether the semantic tier may be used for this question
+            
+        Returns:
+            dict or None: Cached answer (as returned by ask_question_structured) or None on a miss
+        """
+        with self._lock:
+            return self._get(question, version, symbol, semantic)
+    
+    def _get(self, question: str, version: int, symbol: Optional[str], semantic: bool) -> Optional[Dict[str, Any]]:
+        """Look up a cached answer (caller holds the lock)."""
+        key = (self._normalize(question), version, symbol)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                return entry[2]
+            self._prune()
+        
+        if not (semantic and self.semantic and self._keys):
+            return None
+        
+        import numpy as np
+        
+        # Cosine similarity against every cached question (embeddings are normalized)
+        scores = self._embeddings @ self._embed(question)
+        now = time.monotonic()
+        for i in np.argsort(scores)[::-1]:
+            if scores[i] < ANSWER_CACHE_SIMILARITY:
+                break
+            cached_key = self._keys[i]
+            ts, cached_symbol, answer = self._entries.get(cached_key, (0.0, None, None))
+            if cached_key[1] == version and cached_symbol == symbol and now - ts <= self.ttl:
+                self._entries.move_to_end(cached_key)
+                logger.debug(f"Semantic answer cache hit ({scores[i]:.3f}) for: {question}")
+                return answer
+        return None
+    
+    def put(self, question: str, version: int, answer: Dict[str, Any], symbol: Optional[str] = None,
+            semantic: bool = True) -> None:
+        """
+        Store an answer.
+        
+        Args:
+            question: User's question
+            version: Context version the answer was computed against
+            answer: Answer to cache (as returned by ask_question_structured)
+            symbol: Symbol the question is about
+            semantic: Whether to index the question for semantic lookups
+        """
+        with self._lock:
+            self._put(question, version, answer, symbol, semantic)
+    
+    def _put(self, question: str, version: int, answer: Dict[str, Any], symbol: Optional[str], semantic: bool) -> None:
+        """Store an answer (caller holds the lock)."""
+        key = (self._normalize(question), version, symbol)
+        is_new = key not in self._entries
+        self._entries[key] = (time.monotonic(), symbol, answer)
+        self._entries.move_to_end(key)
+        
+        if semantic and self.semantic and is_new:
+            import numpy as np
+            
+            embedding = self._embed(question)
+            if self._embeddings is None:
+                self._embeddings = embedding[np.newaxis, :]
+            else:
+                self._embeddings = np.vstack([self._embeddings, embedding])
+            self._keys.append(key)
+        
+        if len(self._entries) > self.max_items:
+            self._prune()
 
 
 class ConversationManager:
@@ -154,8 +553,11 @@ class ConversationManager:
             context_manager: Context manager instance
         """
         self.context_manager = context_manager
-        self.history = []
+        self.history = deque(maxlen=CONVERSATION_HISTORY_MAX)  # Keeps only the last N exchanges
+        # Pre-formatted snippets of the most recent exchanges for get_history_context
+        self._history_snippets = deque(maxlen=CONVERSATION_CONTEXT_EXCHANGES)
         self.last_symbol = None  # Track the last symbol discussed
+        self._lock = threading.Lock()  # ask_question may run in worker threads
         
     def add_exchange(self, question, answer):
         """
@@ -165,11 +567,9 @@ class ConversationManager:
             question: User's question
             answer: System's answer
         """
-        self.history.append({"question": question, "answer": answer, "timestamp": time.time()})
-        
-        # Keep only the last N exchanges
-        if len(self.history) > CONVERSATION_HISTORY_MAX:
-            self.history = self.history[-CONVERSATION_HISTORY_MAX:]
+        with self._lock:
+            self.history.append({"question": question, "answer": answer, "timestamp": time.time()})
+            self._history_snippets.append(f"User: {question}\nAssistant: {answer}\n\n")
             
     def get_history_context(self):
         """
@@ -178,15 +578,11 @@ class ConversationManager:
         Returns:
             str: Formatted conversation history
         """
-        if not self.history:
-            return ""
-            
-        history_text = "\nRecent conversation history:\n"
-        for i, exchange in enumerate(self.history[-3:]):  # Only include last 3 exchanges
-            history_text += f"User: {exchange['question']}\n"
-            history_text += f"Assistant: {exchange['answer']}\n\n"
-            
-        return history_text
+        with self._lock:
+            if not self._history_snippets:
+                return ""
+                
+            return "\nRecent conversation history:\n" + "".join(self._history_snippets)
     
     def detect_symbol(self, question):
         """
@@ -198,36 +594,12 @@ class ConversationManager:
         Returns:
             str or None: Detected symbol or None
         """
-        # List of supported symbols
-        symbols = ["XAUUSD", "XAGUSD", "WTICOUSD", "BCOUSD", "NATGASUSD", "CORNUSD", "SOYBNUSD", "WHEATUSD"]
-        
-        # Also check common names
-        symbol_aliases = {
-            "gold": "XAUUSD", 
-            "silver": "XAGUSD", 
-            "wti": "WTICOUSD", 
-            "crude": "WTICOUSD",
-            "oil": "WTICOUSD", 
-            "brent": "BCOUSD",
-            "natural gas": "NATGASUSD", 
-            "natgas": "NATGASUSD",
-            "corn": "CORNUSD", 
-            "soybean": "SOYBNUSD", 
-            "soybeans": "SOYBNUSD", 
-            "wheat": "WHEATUSD"
-        }
-        
-        # Check for exact symbol matches
-        for symbol in symbols:
-            if symbol in question.upper():
-                self.last_symbol = symbol
-                return symbol
-                
-        # Check for aliases
-        for alias, symbol in symbol_aliases.items():
-            if alias.lower() in question.lower():
-                self.last_symbol = symbol
-                return symbol
+        # Symbols and aliases in a single pass: the first one mentioned wins
+        match = SYMBOL_RE.search(question)
+        if match:
+            symbol = _ALIAS_TO_SYMBOL[match.group(1).lower()]
+            self.last_symbol = symbol
+            return symbol
                 
         # If no symbol found but we have a last symbol from context, use that
         return self.last_symbol
@@ -246,39 +618,19 @@ class ConversationManager:
         if not question.startswith("/"):
             return None, None
             
-        parts = question.split(" ", 1)
-        command = parts[0][1:].lower()  # Remove the / and convert to lowercase
-        args = parts[1] if len(parts) > 1 else ""
-        
-        # List of supported commands
-        if command in ["analizza", "analyze"]:
-            symbol = args.strip().upper() if args else self.detect_symbol(question)
-            return "analyze", {"symbol": symbol}
-            
-        elif command in ["pattern", "patterns"]:
-            symbol = args.strip().upper() if args else self.detect_symbol(question)
-            return "patterns", {"symbol": symbol}
-            
-        elif command in ["rischio", "risk"]:
-            return "risk", {}
-            
-        elif command in ["ottimizza", "optimize"]:
-            return "optimize", {}
-            
-        elif command in ["correlazioni", "correlations"]:
-            return "correlations", {}
-            
-        elif command in ["news", "notizie"]:
-            symbol = args.strip().upper() if args else self.detect_symbol(question)
-            return "news", {"symbol": symbol}
-            
-        elif command in ["scenario", "scenarios"]:
-            return "scenarios", {}
-            
-        elif command in ["help", "aiuto"]:
-            return "help", {}
+        command, _, args = question[1:].partition(" ")
+        command = command.lower()  # Remove the / and convert to lowercase
+        args = args.strip()  # Stripped once, so whitespace-only arguments count as missing
+        
+        canonical = COMMAND_ALIASES.get(command)
+        if canonical is None:
+            return None, None
+        
+        if canonical in SYMBOL_COMMANDS:
+            symbol = args.upper() if args else self.detect_symbol(question)
+            return canonical, {"symbol": symbol}
             
-        elif command in ["chart", "grafico"]:
+        if canonical == "chart":
             # /chart SIMBOLO [periodo] [intervallo]
             # es. /chart XAUUSD 6mo 1d
             parts_args = args.split()
@@ -289,154 +641,144 @@ class ConversationManager:
                  return "chart_error", {"message": "Per favore, specifica un simbolo per il grafico o discuti di un simbolo prima."}
             return "chart", {"symbol": symbol, "period": period, "interval": interval}
             
-        # Not a recognized command
-        return None, None
+        return canonical, {}
 
 
 # Create managers
 context_manager = Context()
 conversation_manager = ConversationManager(context_manager)
+answer_cache = AnswerCache()
 
 
-def ask_question(question: str, refresh: bool = False) -> str:
-    """
-    Ask a question using DeepSeek.
-    
-    Args:
-        question: Question to ask
-        refresh: Whether to force context refresh
+class CommandUsageError(Exception):
+    """Raised by a command handler when the command is missing a required argument."""
+
+
+def _cmd_analyze(params: Dict[str, Any], deepseek) -> Tuple[str, Any]:
+    """Handle /analyze: market factor analysis for a symbol."""
+    symbol = params.get("symbol")
+    if not symbol:
+        raise CommandUsageError("Per favore, specifica un simbolo da analizzare.")
         
-    Returns:
-        str: Answer to the question
-    """
-    # Check if DeepSeek is available
-    if not DEEPSEEK_AVAILABLE:
-        return "DeepSeek is not available. Please install the required dependencies."
+    logger.info(f"Analyzing market factors for {symbol}...")
+    context = context_manager.get()
+    price_data = context.get("prices", {}).get(symbol, {})
+    cot_data = context.get("cot", {}).get(symbol, [])
+    
+    result = deepseek.analyze_market_factors(
+        symbol=symbol,
+        price_data=price_data,
+        cot_data=cot_data,
+        offline=False
+    )
+    
+    return f"## Analisi di mercato per {symbol}\n\n", result
+
+
+def _cmd_patterns(params: Dict[str, Any], deepseek) -> Tuple[str, Any]:
+    """Handle /patterns: technical pattern recognition for a symbol."""
+    symbol = params.get("symbol")
+    if not symbol:
+        raise CommandUsageError("Per favore, specifica un simbolo per l'analisi dei pattern.")
         
-    # Refresh context if requested
-    if refresh:
-        context_manager.refresh()
+    logger.info(f"Recognizing patterns for {symbol}...")
+    context = context_manager.get()
+    price_data = context.get("prices", {}).get(symbol, {})
+    
+    result = deepseek.pattern_recognition(
+        symbol=symbol, 
+        price_data=price_data,
+        offline=False
+    )
+    
+    return f"## Pattern riconosciuti per {symbol}\n\n", result
+
+
+def _cmd_optimize(params: Dict[str, Any], deepseek) -> Tuple[str, Any]:
+    """Handle /optimize: portfolio optimization of the current positions."""
+    logger.info("Optimizing portfolio...")
+    context = context_manager.get()
+    positions = context.get("positions", [])
+    
+    result = deepseek.portfolio_optimization(
+        current_positions=positions,
+        risk_profile="moderate",  # Default
+        offline=False
+    )
+    
+    return "## Ottimizzazione del portafoglio\n\n", result
+
+
+def _cmd_scenarios(params: Dict[str, Any], deepseek) -> Tuple[str, Any]:
+    """Handle /scenarios: scenario analysis of the current positions."""
+    logger.info("Running scenario analysis...")
+    context = context_manager.get()
+    positions = context.get("positions", [])
+    
+    result = deepseek.scenario_analysis(
+        current_positions=positions,
+        offline=False
+    )
+    
+    return "## Analisi degli scenari\n\n", result
+
+
+def _cmd_news(params: Dict[str, Any], deepseek) -> Tuple[str, Any]:
+    """Handle /news: latest news for a symbol."""
+    symbol = params.get("symbol")
+    if not symbol:
+        raise CommandUsageError("Per favore, specifica un simbolo per le notizie.")
         
-    # Check for special commands
-    command, params = conversation_manager.parse_command(question)
+    logger.info(f"Fetching news for {symbol}...")
+    news = deepseek.fetch_commodity_news(symbol, max_results=5, offline=False)
     
-    # Execute command if detected
-    answer = ""
-    if command:
-        try:
-            if command == "analyze":
-                symbol = params.get("symbol")
-                if not symbol:
-                    return "Per favore, specifica un simbolo da analizzare."
-                    
-                logger.info(f"Analyzing market factors for {symbol}...")
-                context = context_manager.get()
-                price_data = context.get("prices", {}).get(symbol, {})
-                cot_data = context.get("cot", {}).get(symbol, [])
-                
-                result = analyze_market_factors(
-                    symbol=symbol,
-                    price_data=price_data,
-                    cot_data=cot_data,
-                    offline=False
-                )
-                
-                answer = f"## Analisi di mercato per {symbol}\n\n"
-                answer += json.dumps(result, indent=2)
-                
-            elif command == "patterns":
-                symbol = params.get("symbol")
-                if not symbol:
-                    return "Per favore, specifica un simbolo per l'analisi dei pattern."
-                    
-                logger.info(f"Recognizing patterns for {symbol}...")
-                context = context_manager.get()
-                price_data = context.get("prices", {}).get(symbol, {})
-                
-                result = pattern_recognition(
-                    symbol=symbol, 
-                    price_data=price_data,
-                    offline=False
-                )
-                
-                answer = f"## Pattern riconosciuti per {symbol}\n\n"
-                answer += json.dumps(result, indent=2)
-                
-            elif command == "optimize":
-                logger.info("Optimizing portfolio...")
-                context = context_manager.get()
-                positions = context.get("positions", [])
-                
-                result = portfolio_optimization(
-                    current_positions=positions,
-                    risk_profile="moderate",  # Default
-                    offline=False
-                )
-                
-                answer = "## Ottimizzazione del portafoglio\n\n"
-                answer += json.dumps(result, indent=2)
-                
-            elif command == "scenarios":
-                logger.info("Running scenario analysis...")
-                context = context_manager.get()
-                positions = context.get("positions", [])
-                
-                result = scenario_analysis(
-                    current_positions=positions,
-                    offline=False
-                )
-                
-                answer = "## Analisi degli scenari\n\n"
-                answer += json.dumps(result, indent=2)
-                
-            elif command == "news":
-                symbol = params.get("symbol")
-                if not symbol:
-                    return "Per favore, specifica un simbolo per le notizie."
-                    
-                logger.info(f"Fetching news for {symbol}...")
-                news = fetch_commodity_news(symbol, max_results=5, offline=False)
-                
-                answer = f"## Ultime notizie per {symbol}\n\n"
-                if news and len(news) > 0:
-                    for item in news:
-                        answer += f"- **{item['title']}** ({item['date']})\n  {item['url']}\n\n"
-                else:
-                    answer += "Nessuna notizia trovata."
+    answer = f"## Ultime notizie per {symbol}\n\n"
+    if news and len(news) > 0:
+        for item in news:
+            answer += f"- **{item['title']}** ({item['date']})\n  {item['url']}\n\n"
+    else:
+        answer += "Nessuna notizia trovata."
+    return answer, None
 
-            elif command == "chart":
-                symbol = params.get("symbol")
-                period = params.get("period")
-                interval = params.get("interval")
-                
-                logger.info(f"Generating chart for {symbol} (period: {period}, interval: {interval})...")
-                
-                data = get_commodity_data(symbol, period=period, interval=interval)
-                
-                if data is not None and not data.empty:
-                    fig = plot_candlestick_chart(data, symbol_display=symbol)
-                    
-                    # Salva il grafico in un file HTML temporaneo
-                    # Usiamo delete=False così il file persiste finché il browser lo legge
-                    with tempfile.NamedTemporaryFile(mode="w", suffix=".html", delete=False, encoding='utf-8') as tmp_file:
-                        fig.write_html(tmp_file.name)
-                        chart_file_path = tmp_file.name
-                    
-                    try:
-                        # Usa Path per costruire un URI file:// corretto per tutti i sistemi operativi
-                        webbrowser.open_new_tab(Path(chart_file_path).resolve().as_uri())
-                        answer = f"Il grafico per {symbol} (periodo: {period}, intervallo: {interval}) è stato generato e aperto nel tuo browser."
-                    except Exception as e:
-                        logger.error(f"Errore nell'aprire il grafico nel browser: {e}")
-                        answer = f"Non è stato possibile aprire il grafico nel browser, ma è stato salvato in: {chart_file_path}"
-                else:
-                    answer = f"Non è stato possibile recuperare i dati per generare il grafico per {symbol} (periodo: {period}, intervallo: {interval})."
 
-            elif command == "chart_error":
-                answer = params.get("message", "Errore sconosciuto nella generazione del grafico.")
-                
-            elif command == "help":
-                answer = """## Comandi disponibili:
+def _cmd_chart(params: Dict[str, Any], deepseek) -> Tuple[str, Any]:
+    """Handle /chart: interactive candlestick chart opened in the browser."""
+    symbol = params.get("symbol")
+    period = params.get("period")
+    interval = params.get("interval")
+    
+    logger.info(f"Generating chart for {symbol} (period: {period}, interval: {interval})...")
+    
+    from charting_utils import get_commodity_data, plot_candlestick_chart
+    
+    price_df = get_commodity_data(symbol, period=period, interval=interval)
+    
+    if price_df is None or price_df.empty:
+        return f"Non è stato possibile recuperare i dati per generare il grafico per {symbol} (periodo: {period}, intervallo: {interval}).", None
+    
+    fig = plot_candlestick_chart(price_df, symbol_display=symbol)
+    
+    # Salva il grafico in un file HTML temporaneo
+    # Usiamo delete=False così il file persiste finché il browser lo legge
+    with tempfile.NamedTemporaryFile(mode="w", suffix=".html", delete=False, encoding='utf-8') as tmp_file:
+        fig.write_html(tmp_file.name)
+        chart_file_path = tmp_file.name
+    
+    try:
+        # Usa Path per costruire un URI file:// corretto per tutti i sistemi operativi
+        webbrowser.open_new_tab(Path(chart_file_path).resolve().as_uri())
+        return f"Il grafico per {symbol} (periodo: {period}, intervallo: {interval}) è stato generato e aperto nel tuo browser.", None
+    except Exception as e:
+        logger.error(f"Errore nell'aprire il grafico nel browser: {e}")
+        return f"Non è stato possibile aprire il grafico nel browser, ma è stato salvato in: {chart_file_path}", None
+
+
+def _cmd_chart_error(params: Dict[str, Any], deepseek) -> Tuple[str, Any]:
+    """Report a /chart request that could not be resolved to a symbol."""
+    return params.get("message", "Errore sconosciuto nella generazione del grafico."), None
+
+
+HELP_TEXT = """## Comandi disponibili:
 
 /analyze [symbol] - Analizza i fattori di mercato per un simbolo
 /patterns [symbol] - Riconosce i pattern tecnici per un simbolo
@@ -451,35 +793,252 @@ Puoi anche fare domande in linguaggio naturale come:
 "Quali sono le prospettive per il petrolio a lungo termine?"
 "Dovrei aumentare l'esposizione sul gas naturale?"
 """
+
+
+# Short help shown in the interactive REPL banner
+REPL_HELP_TEXT = """Comandi speciali:
+/analyze [symbol] - Analizza i fattori di mercato
+/patterns [symbol] - Identifica pattern tecnici
+/news [symbol] - Mostra le ultime notizie
+/optimize - Ottimizza il portafoglio
+/scenarios - Analisi scenari di mercato
+/help - Mostra questo messaggio
+
+'exit' o 'quit' per uscire, 'refresh' per aggiornare il contesto"""
+
+
+def _cmd_help(params: Dict[str, Any], deepseek) -> Tuple[str, Any]:
+    """Handle /help: list of available commands."""
+    return HELP_TEXT, None
+
+
+# Canonical command -> handler returning (Markdown answer, structured data or None).
+# Commands without a handler (risk, correlations) are answered by the QA model.
+COMMAND_HANDLERS = {
+    "analyze": _cmd_analyze,
+    "patterns": _cmd_patterns,
+    "optimize": _cmd_optimize,
+    "scenarios": _cmd_scenarios,
+    "news": _cmd_news,
+    "chart": _cmd_chart,
+    "chart_error": _cmd_chart_error,
+    "help": _cmd_help,
+}
+
+
+def ask_question_structured(question: str, refresh: bool = False) -> Dict[str, Any]:
+    """
+    Ask a question using DeepSeek, keeping structured command results as data.
+    
+    Args:
+        question: Question to ask
+        refresh: Whether to force context refresh
+        
+    Returns:
+        dict: 'answer' with the Markdown text (just the heading for commands that
+              return structured results) and 'data' with the structured result or None
+    """
+    # Check if DeepSeek is available
+    deepseek = _get_deepseek()
+    if deepseek is None:
+        return {"answer": "DeepSeek is not available. Please install the required dependencies.", "data": None}
+        
+    # Refresh context if requested
+    if refresh:
+        context_manager.refresh(force=True)
+        
+    # Check for special commands
+    command, params = conversation_manager.parse_command(question)
+    
+    # Refresh if due, then take the version before the context (see Context._refresh_sync):
+    # the answer is stored under this version, never under one read after a later refresh
+    context_manager.get()
+    version = context_manager.version
+    
+    # Reuse a previous answer computed against the same context, if any
+    cacheable = command not in NO_CACHE_COMMANDS
+    if cacheable:
+        # Commands are matched exactly; only natural-language questions use the semantic tier
+        semantic = command is None
+        symbol = conversation_manager.detect_symbol(question) if semantic else None
+        # Commands are keyed by their resolved form, so "/analyze" without a symbol
+        # (resolved from the conversation) and aliases map to the right entry
+        cache_question = question if semantic else f"/{command} {sorted(params.items())}"
+        cached_result = answer_cache.get(cache_question, version, symbol, semantic)
+        if cached_result is not None:
+            logger.info("Answer cache hit")
+            conversation_manager.add_exchange(question, _format_answer(cached_result))
+            return cached_result
+    
+    # Execute command if detected
+    answer = ""
+    data = None
+    if command:
+        try:
+            handler = COMMAND_HANDLERS.get(command)
+            if handler is not None:
+                answer, data = handler(params, deepseek)
+        except CommandUsageError as e:
+            return {"answer": str(e), "data": None}
         except Exception as e:
             logger.error(f"Error executing command {command}: {e}")
             answer = f"Si è verificato un errore durante l'esecuzione del comando: {str(e)}"
     
     # If not a command or command failed, use QA
     if not answer:
-        # Get current context with conversation history
-        context = context_manager.get()
-        
-        # Add conversation history to context
+        # Add the version and conversation history to a copy of the (shared, read-only)
+        # context; the version lets qa key its cache without serializing the data
+        context = {**context_manager.context, "_version": version}
         history_context = conversation_manager.get_history_context()
-        if history_context and isinstance(context, dict):
+        if history_context:
             context["conversation_history"] = history_context
         
         # Call DeepSeek QA
-        answer = qa(question, context, offline=False)
+        answer = deepseek.qa(question, context, offline=False)
+    
+    result = {"answer": answer, "data": data}
+    if (cacheable and answer and not isinstance(answer, deepseek.FallbackResponse)
+            and not answer.startswith(UNCACHEABLE_ANSWER_PREFIXES)):
+        answer_cache.put(cache_question, version, result, symbol, semantic)
+    
+    # Add to conversation history (as text, since it is fed back to the model)
+    conversation_manager.add_exchange(question, _format_answer(result))
     
-    # Add to conversation history
-    conversation_manager.add_exchange(question, answer)
+    return result
+
+
+def ask_question(question: str, refresh: bool = False) -> str:
+    """
+    Ask a question using DeepSeek.
     
-    return answer
+    Args:
+        question: Question to ask
+        refresh: Whether to force context refresh
+        
+    Returns:
+        str: Answer to the question
+    """
+    return _format_answer(ask_question_structured(question, refresh))
 
 
-# FastAPI app (if available)
-if FASTAPI_AVAILABLE:
+def _format_answer(result: Dict[str, Any]) -> str:
+    """Render a structured answer as Markdown text, with any data as indented JSON."""
+    if result["data"] is None:
+        return result["answer"]
+    return result["answer"] + _json_pretty(result["data"])
+
+
+def _command_question(command: str, symbol: Optional[str] = None) -> str:
+    """Build the synthetic command-format question for an API command request."""
+    cmd_question = f"/{command}"
+    if symbol:
+        cmd_question += f" {symbol}"
+    return cmd_question
+
+
+class AskBatcher:
+    """Coalesces concurrent questions into small batches answered together."""
+    
+    def __init__(self, max_batch_size: int = ASK_BATCH_MAX_SIZE, max_delay: float = ASK_BATCH_MAX_DELAY):
+        """
+        Initialize the batcher.
+        
+        Args:
+            max_batch_size: Number of pending questions that triggers an immediate batch
+            max_delay: Maximum time in seconds a question waits for others to join its batch
+        """
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._pending: List[Tuple[str, bool, asyncio.Future]] = []
+        self._flush_handle = None
+        self._tasks = set()  # Keep references to running batches
+    
+    async def ask(self, question: str, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Queue a question and wait for its answer.
+        
+        Args:
+            question: Question to ask
+            refresh: Whether to force context refresh
+            
+        Returns:
+            dict: Answer as returned by ask_question_structured
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((question, refresh, future))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_delay, self._flush)
+            
+        return await future
+    
+    def _flush(self) -> None:
+        """Start answering the pending questions as one batch."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+            
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, batch: List[Tuple[str, bool, asyncio.Future]]) -> None:
+        """Answer a batch: one context refresh, one call per distinct question, run concurrently."""
+        futures_by_question: Dict[str, List[asyncio.Future]] = {}
+        for question, _, future in batch:
+            futures_by_question.setdefault(question, []).append(future)
+        
+        # The context is shared by the whole batch: refresh it once, off the event loop
+        if any(refresh for _, refresh, _ in batch):
+            await asyncio.to_thread(context_manager.refresh, True)
+        
+        results = await asyncio.gather(
+            *(asyncio.to_thread(ask_question_structured, question) for question in futures_by_question),
+            return_exceptions=True
+        )
+        
+        for futures, result in zip(futures_by_question.values(), results):
+            for future in futures:
+                if future.done():  # Client went away
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+def _build_app():
+    """Build the FastAPI app (imports FastAPI only when the server is actually needed)."""
+    from fastapi import FastAPI, HTTPException
+    from fastapi.middleware.cors import CORSMiddleware
+    from pydantic import BaseModel
+    if ORJSON_AVAILABLE:
+        from fastapi.responses import ORJSONResponse as DefaultResponse
+    else:
+        from fastapi.responses import JSONResponse as DefaultResponse
+    
+    @asynccontextmanager
+    async def lifespan(app):
+        """Size the thread pool for blocking endpoint work and start the context refresh task."""
+        executor = ThreadPoolExecutor(max_workers=API_WORKER_THREADS, thread_name_prefix="chat-api")
+        asyncio.get_running_loop().set_default_executor(executor)
+        # Keep the context fresh in the background so requests never parse files inline
+        refresh_task = asyncio.create_task(context_manager.refresh_loop())
+        yield
+        refresh_task.cancel()
+        executor.shutdown(wait=False)
+    
     app = FastAPI(
         title="OpenMT4TradingBot Chat API",
         description="API for interacting with the trading bot using natural language",
-        version="1.0.0"
+        version="1.0.0",
+        default_response_class=DefaultResponse,
+        lifespan=lifespan
     )
     
     # Add CORS middleware
@@ -502,14 +1061,27 @@ if FASTAPI_AVAILABLE:
     
     class ConversationHistoryResponse(BaseModel):
         history: list
+    
+    class BatchSubRequest(BaseModel):
+        id: str
+        question: Optional[str] = None  # Natural-language question, as for /ask
+        command: Optional[str] = None   # Command name, as for /command/{command}
+        symbol: Optional[str] = None
+    
+    class BatchRequest(BaseModel):
+        requests: List[BatchSubRequest]
+        force_refresh: bool = False
+    
+    ask_batcher = AskBatcher()
         
     @app.post("/ask")
     async def api_ask(request: QuestionRequest):
         """API endpoint for asking questions."""
         try:
-            answer = ask_question(request.question, refresh=request.force_refresh)
+            result = await ask_batcher.ask(request.question, refresh=request.force_refresh)
             return {
-                "answer": answer, 
+                "answer": result["answer"],
+                "data": result["data"],  # Structured command result, serialized once by the response class
                 "conversation_id": "current",  # For now we only support one conversation
                 "timestamp": int(time.time())
             }
@@ -521,7 +1093,8 @@ if FASTAPI_AVAILABLE:
     async def api_context():
         """API endpoint for getting the current context."""
         try:
-            return context_manager.get()
+            # refresh() may parse the context files: keep it off the event loop
+            return dict(await asyncio.to_thread(context_manager.get))
         except Exception as e:
             logger.error(f"Error in /context endpoint: {e}")
             raise HTTPException(status_code=500, detail=str(e))
@@ -530,7 +1103,7 @@ if FASTAPI_AVAILABLE:
     async def api_conversation():
         """API endpoint for getting the conversation history."""
         try:
-            return {"history": conversation_manager.history}
+            return {"history": list(conversation_manager.history)}
         except Exception as e:
             logger.error(f"Error in /conversation endpoint: {e}")
             raise HTTPException(status_code=500, detail=str(e))
@@ -539,16 +1112,54 @@ if FASTAPI_AVAILABLE:
     async def api_command(command: str, request: dict = {}):
         """API endpoint for executing specific commands."""
         try:
-            # Create a synthetic question in command format
-            cmd_question = f"/{command}"
-            if "symbol" in request and request["symbol"]:
-                cmd_question += f" {request['symbol']}"
-                
-            answer = ask_question(cmd_question, refresh=True)
-            return {"result": answer}
+            result = await ask_batcher.ask(_command_question(command, request.get("symbol")), refresh=True)
+            return {"result": result["answer"], "data": result["data"]}
         except Exception as e:
             logger.error(f"Error in /command endpoint: {e}")
             raise HTTPException(status_code=500, detail=str(e))
+    
+    @app.post("/batch")
+    async def api_batch(request: BatchRequest):
+        """API endpoint for running several questions/commands in one round trip."""
+        async def run(sub: BatchSubRequest) -> Dict[str, Any]:
+            if sub.command:
+                result = await ask_batcher.ask(_command_question(sub.command, sub.symbol))
+                return {"id": sub.id, "status": 200, "body": {"result": result["answer"], "data": result["data"]}}
+            if sub.question:
+                result = await ask_batcher.ask(sub.question)
+                return {"id": sub.id, "status": 200, "body": {"answer": result["answer"], "data": result["data"]}}
+            return {"id": sub.id, "status": 400, "body": {"detail": "Either 'question' or 'command' is required"}}
+        
+        # Refresh the context once for all sub-requests
+        if request.force_refresh or any(sub.command for sub in request.requests):
+            await asyncio.to_thread(context_manager.refresh, True)
+        
+        results = await asyncio.gather(*(run(sub) for sub in request.requests), return_exceptions=True)
+        responses = []
+        for sub, result in zip(request.requests, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error in /batch sub-request {sub.id}: {result}")
+                result = {"id": sub.id, "status": 500, "body": {"detail": str(result)}}
+            responses.append(result)
+        return {"responses": responses}
+    
+    return app
+
+
+def _get_app():
+    """Return the FastAPI app, building it on first use."""
+    global _app
+    if _app is None:
+        _app = _build_app()
+    return _app
+
+
+def __getattr__(name):
+    """Build `app` lazily when accessed, e.g. by `uvicorn chat_interface:app`."""
+    if name == "app" and FASTAPI_AVAILABLE:
+        return _get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 def run_cli():
     """Run the command-line interface."""
@@ -575,48 +1186,53 @@ def run_cli():
             return
             
         print(f"Starting web server on port {args.port}...")
-        uvicorn.run("chat_interface:app", host="0.0.0.0", port=args.port, reload=False)
+        import uvicorn
+        
+        # Conversation history, answer cache and context live in memory per process:
+        # more workers scale throughput but each one keeps its own conversation
+        workers = int(os.environ.get("CHAT_API_WORKERS", "1"))
+        uvicorn.run(
+            "chat_interface:app" if workers > 1 else _get_app(),
+            host="0.0.0.0",
+            port=args.port,
+            reload=False,
+            workers=workers,
+            loop="uvloop" if UVLOOP_AVAILABLE else "asyncio",
+            http="httptools" if HTTPTOOLS_AVAILABLE else "h11"
+        )
         return
     
     # Check for command-line commands
     if args.analyze:
-        answer = ask_question(f"/analyze {args.analyze}", refresh=args.refresh)
-        _print_answer(answer)
+        _print_answer(ask_question_structured(f"/analyze {args.analyze}", refresh=args.refresh))
         return
         
     if args.patterns:
-        answer = ask_question(f"/patterns {args.patterns}", refresh=args.refresh)
-        _print_answer(answer)
+        _print_answer(ask_question_structured(f"/patterns {args.patterns}", refresh=args.refresh))
         return
         
     if args.news:
-        answer = ask_question(f"/news {args.news}", refresh=args.refresh)
-        _print_answer(answer)
+        _print_answer(ask_question_structured(f"/news {args.news}", refresh=args.refresh))
         return
         
     if args.optimize:
-        answer = ask_question("/optimize", refresh=args.refresh)
-        _print_answer(answer)
+        _print_answer(ask_question_structured("/optimize", refresh=args.refresh))
         return
         
     if args.scenarios:
-        answer = ask_question("/scenarios", refresh=args.refresh)
-        _print_answer(answer)
+        _print_answer(ask_question_structured("/scenarios", refresh=args.refresh))
         return
         
     # If no question provided, enter interactive mode
     if not args.question:
+        # Keep the context fresh in the background between questions
+        context_manager.start_refresh_thread()
+        
         if RICH_AVAILABLE:
+            from rich.panel import Panel
+            console = _get_console()
             console.print(Panel.fit("OpenMT4TradingBot Chat Interface", style="blue"))
-            console.print(Panel("""Comandi speciali:
-/analyze [symbol] - Analizza i fattori di mercato
-/patterns [symbol] - Identifica pattern tecnici
-/news [symbol] - Mostra le ultime notizie
-/optimize - Ottimizza il portafoglio
-/scenarios - Analisi scenari di mercato
-/help - Mostra questo messaggio
-
-'exit' o 'quit' per uscire, 'refresh' per aggiornare il contesto""", title="Aiuto", border_style="green"))
+            console.print(Panel(REPL_HELP_TEXT, title="Aiuto", border_style="green"))
             
             while True:
                 question = console.input("[bold blue]> [/bold blue]")
@@ -625,15 +1241,14 @@ def run_cli():
                     break
                     
                 if question.lower() == "refresh":
-                    context_manager.refresh()
+                    context_manager.refresh(force=True)
                     console.print("[green]Contesto aggiornato[/green]")
                     continue
                 
                 if question.lower() in ["help", "aiuto", "?"]:
                     question = "/help"
                     
-                answer = ask_question(question)
-                console.print(Markdown(answer))
+                _print_answer(ask_question_structured(question))
                 print()
         else:
             print("OpenMT4TradingBot Chat Interface")
@@ -647,7 +1262,7 @@ def run_cli():
                     break
                     
                 if question.lower() == "refresh":
-                    context_manager.refresh()
+                    context_manager.refresh(force=True)
                     print("Contesto aggiornato")
                     continue
                     
@@ -660,16 +1275,19 @@ def run_cli():
                 
     # Answer single question
     else:
-        answer = ask_question(args.question, refresh=args.refresh)
-        _print_answer(answer)
+        _print_answer(ask_question_structured(args.question, refresh=args.refresh))
 
 
-def _print_answer(answer):
-    """Helper function to print an answer with formatting if available."""
+def _print_answer(result):
+    """Helper function to print a structured answer with formatting if available."""
     if RICH_AVAILABLE:
-        console.print(Markdown(answer))
+        from rich.markdown import Markdown
+        console = _get_console()
+        console.print(Markdown(result["answer"]))
+        if result["data"] is not None:
+            console.print_json(data=result["data"])
     else:
-        print(answer)
+        print(_format_answer(result))
 
 
 if __name__ == "__main__":
@@ -13,25 +13,38 @@ Copyright (c) 2025 Immaginet Srl
 """
 
 import os
+import re
 import time
 import json
-import gzip
+import hashlib
 import random
 import logging
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
 import numpy as np
 from typing import Dict, List, Tuple, Optional, Any, Union
 from pathlib import Path
 from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from functools import lru_cache
 
+# Try importing orjson for faster JSON serialization of cache entries
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Importa il tracker di utilizzo API
 import api_usage_tracker as usage_tracker
 
 # Importa il gestore delle chiavi di cache
-from cache_key_manager import CacheKeyManager
+from cache_key_manager import (CacheKeyManager, CACHE_DATA_SUFFIXES, CACHE_TYPE_DIRS,
+                               read_cache_file, write_cache_file)
 
 # Configure logging
 logging.basicConfig(
@@ -53,16 +66,22 @@ CACHE_TTL = {
     "pattern": 3600,           # 1 hour for pattern recognition
     "portfolio": 1200,         # 20 minutes for portfolio optimization
     "scenario": 1800,          # 30 minutes for scenario analysis
+    "throttled": 60,           # 1 minute for fallback responses while throttled (memory only)
 }
 
 # Cache size limits
 MAX_MEMORY_CACHE_ITEMS = 100
+# Byte budget for the in-memory cache (serialized size of the entries): a few large pattern
+# or QA results must not grow the process as much as 100 of them would
+MAX_MEMORY_CACHE_BYTES = int(float(os.environ.get("DEEPSEEK_MEMORY_CACHE_MB", "8")) * 1024 * 1024)
 MAX_DISK_CACHE_SIZE_MB = 100
 
 # Compression settings
 COMPRESSION_ENABLED = True
-COMPRESSION_LEVEL = 6  # 0-9, where 9 is max compression (but slower)
-COMPRESSION_THRESHOLD = 1024  # Only compress items larger than this many bytes
+# 0-9, where 9 is max compression (but slower); cache entries are written far more
+# often than they are read, so the fastest level is the default
+COMPRESSION_LEVEL = int(os.environ.get("DEEPSEEK_GZIP_LEVEL", "1"))
+COMPRESSION_THRESHOLD = 1024  # Only compress items larger than this many bytes (smaller ones are stored raw)
 
 # Inizializza il gestore delle chiavi di cache
 cache_key_manager = CacheKeyManager(CACHE_DIR)
@@ -70,18 +89,86 @@ cache_key_manager = CacheKeyManager(CACHE_DIR)
 # News API settings
 NEWS_API_KEY = os.environ.get("NEWS_API_KEY", "")
 NEWS_API_BASE = "https://newsapi.org/v2/everything"
+NEWS_PAGE_SIZE = 15        # Headlines per symbol
+NEWS_BATCH_PAGE_SIZE = 100  # Maximum page size of NewsAPI, for multi-symbol queries
+
+# Symbol to NewsAPI keyword query mapping
+NEWS_KEYWORDS = {
+    "XAUUSD": "gold OR \"precious metals\"",
+    "XAGUSD": "silver OR \"precious metals\"",
+    "WTICOUSD": "WTI OR crude OR oil",
+    "BCOUSD": "brent OR crude OR oil",
+    "NATGASUSD": "natural gas",
+    "CORNUSD": "corn OR grain",
+    "SOYBNUSD": "soybean OR grain",
+    "WHEATUSD": "wheat OR grain"
+}
+
+# Compiled once: whole-word, case-insensitive matchers for the keywords of each symbol,
+# used to assign the articles of a multi-symbol query ("oil" must not match "soil")
+NEWS_KEYWORD_PATTERNS = {
+    symbol: re.compile(r"\b(?:" + "|".join(re.escape(term.strip('"')) for term in query.split(" OR ")) + r")\b",
+                       re.IGNORECASE)
+    for symbol, query in NEWS_KEYWORDS.items()
+}
 
 # Ensure cache directory exists
 CACHE_DIR.mkdir(exist_ok=True)
 
-# In-memory LRU cache
-MEMORY_CACHE = {}
+# In-memory LRU cache (most recently used entries at the end)
+MEMORY_CACHE = OrderedDict()
+_memory_cache_bytes = 0  # Sum of the 'size' of the entries in MEMORY_CACHE
+_MEMORY_CACHE_LOCK = threading.Lock()  # Guards MEMORY_CACHE and _memory_cache_bytes
+
+# DeepSeek requests in progress (cache key -> _Flight): identical concurrent requests
+# wait for the first one instead of each calling the API
+_INFLIGHT = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+# Single background thread for disk writes and cleanup: callers don't wait for compression
+# and I/O, and writes never race with cleanup. Pending writes are flushed at interpreter
+# exit, since concurrent.futures joins its worker threads.
+_CACHE_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-writer")
+
+# Cache files on disk: path -> (mtime, size, cache_type). Loaded once and kept up to date
+# by the writer thread (the only one touching it), so cleanup needs no directory walk.
+# Files written by other processes are picked up at the next start.
+_CACHE_INDEX: Dict[Path, Tuple[float, int, str]] = {}
+_cache_index_loaded = False
 
 # Load API key and base URL from environment variables
 API_KEY = os.environ.get("DEEPSEEK_API_KEY", "")
 API_BASE = os.environ.get("DEEPSEEK_API_BASE", "https://api.deepseek.com/v1")
 MODEL = os.environ.get("DEEPSEEK_MODEL", DEFAULT_MODEL)
 
+
+def _make_session(headers: Optional[Dict[str, str]] = None) -> requests.Session:
+    """Create an HTTP session with pooled keep-alive connections and retries.
+    
+    Args:
+        headers: Headers sent with every request of the session
+        
+    Returns:
+        Configured requests.Session
+    """
+    session = requests.Session()
+    # Retry connection errors and transient statuses; urllib3 only retries idempotent
+    # methods on a status, so a completion POST that reached the server is never resent
+    retries = Retry(total=2, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries))
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+# One session per API: connections (and TLS handshakes) are reused across calls,
+# and the DeepSeek key is only ever sent to DeepSeek
+DEEPSEEK_SESSION = _make_session({
+    "Authorization": f"Bearer {API_KEY}",
+    "Content-Type": "application/json"
+})
+NEWS_SESSION = _make_session()
+
 # Configura il logger anche per il cache key manager
 logging.getLogger('cache_key_manager').setLevel(logging.INFO)
 
@@ -89,6 +176,49 @@ logging.getLogger('cache_key_manager').setLevel(logging.INFO)
 DAILY_COST_LIMIT = float(os.environ.get("DEEPSEEK_DAILY_LIMIT", "5.0"))  # Default $5/giorno
 usage_tracker.set_daily_cost_limit(DAILY_COST_LIMIT)
 
+def _json_dumps(obj: Any) -> bytes:
+    """Serialize to compact JSON bytes, using orjson if available."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def _json_loads(data: bytes) -> Any:
+    """Deserialize JSON bytes, using orjson if available."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FallbackResponse(str):
+    """A text returned in place of a model answer (offline, throttled, API error).
+    
+    It behaves as a normal string; callers check isinstance(..., FallbackResponse)
+    to avoid caching it as if it were an answer.
+    """
+    __slots__ = ()
+
+
+def _stable_key(*parts: Any) -> str:
+    """Hash JSON-serializable parts into a cache key that is stable across processes.
+    
+    Unlike the built-in hash(), which is salted per process, the key survives
+    restarts so the disk cache can be reused.
+    
+    Args:
+        parts: Values to include in the key (dict keys are sorted)
+        
+    Returns:
+        128-bit BLAKE2b hex digest
+    """
+    if ORJSON_AVAILABLE:
+        payload = orjson.dumps(parts, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+                               | orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        payload = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':')).encode('utf-8')
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
 def _get_cache_path(cache_key: str, cache_type: str = "default") -> Path:
     """Get cache file path for a given key and type.
     
@@ -103,55 +233,59 @@ def _get_cache_path(cache_key: str, cache_type: str = "default") -> Path:
     return cache_key_manager.get_cache_path(cache_key, cache_type)
 
 
+def _load_cache_index():
+    """Build _CACHE_INDEX with one os.scandir walk of the cache (runs on the cache writer thread)."""
+    global _cache_index_loaded
+    _cache_index_loaded = True
+    dir_types = {dir_name: cache_type for cache_type, dir_name in CACHE_TYPE_DIRS.items()}
+    for type_dir in CACHE_DIR.iterdir():
+        cache_type = dir_types.get(type_dir.name)
+        if cache_type is None or not type_dir.is_dir():
+            continue
+        pending = [type_dir]
+        while pending:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.name.endswith(CACHE_DATA_SUFFIXES):
+                        # DirEntry.stat() reuses the information read by scandir where possible
+                        st = entry.stat(follow_symlinks=False)
+                        _CACHE_INDEX[Path(entry.path)] = (st.st_mtime, st.st_size, cache_type)
+    logger.debug(f"Cache index loaded: {len(_CACHE_INDEX)} files")
+
+
 def _clean_cache():
-    """Clean up old cache files and enforce size limits."""
+    """Clean up old cache files and enforce size limits (runs on the cache writer thread)."""
     # Check if we need to clean up (do this occasionally, not on every access)
     if random.random() < 0.05:  # 5% chance to trigger cleanup
         try:
-            # Delete expired files
+            # Delete expired files (the index already has age and size, no stat() needed)
             current_time = time.time()
-            
-            # Check and enforce total cache size
             total_size = 0
-            file_info = []
             
-            # Gather info about all cache files
-            for cache_type_dir in CACHE_DIR.iterdir():
-                if not cache_type_dir.is_dir():
-                    continue
-                    
-                for cache_file in cache_type_dir.iterdir():
-                    if not cache_file.is_file():
-                        continue
-                        
-                    file_stat = cache_file.stat()
-                    file_age = current_time - file_stat.st_mtime
-                    file_size = file_stat.st_size
+            for cache_file, (mtime, file_size, cache_type) in list(_CACHE_INDEX.items()):
+                ttl = CACHE_TTL.get(cache_type, CACHE_TTL["default"])
+                if current_time - mtime > ttl:
+                    cache_file.unlink(missing_ok=True)
+                    del _CACHE_INDEX[cache_file]
+                else:
                     total_size += file_size
-                    
-                    # Get the cache type from directory name
-                    cache_type = cache_type_dir.name
-                    ttl = CACHE_TTL.get(cache_type, CACHE_TTL["default"])
-                    
-                    # Delete expired files immediately
-                    if file_age > ttl:
-                        cache_file.unlink(missing_ok=True)
-                    else:
-                        file_info.append((cache_file, file_age, file_size))
             
             # Check if we're over the size limit (convert MB to bytes)
             max_size_bytes = MAX_DISK_CACHE_SIZE_MB * 1024 * 1024
             if total_size > max_size_bytes:
-                # Sort by age (oldest first)
-                file_info.sort(key=lambda x: x[1], reverse=True)
+                # Sort by modification time (oldest first)
+                file_info = sorted(_CACHE_INDEX.items(), key=lambda item: item[1][0])
                 
                 # Delete oldest files until we're under the limit
                 deleted_count = 0
                 freed_space = 0
-                for file_path, _, file_size in file_info:
+                for file_path, (_, file_size, _) in file_info:
                     if total_size <= max_size_bytes:
                         break
                     file_path.unlink(missing_ok=True)
+                    del _CACHE_INDEX[file_path]
                     total_size -= file_size
                     deleted_count += 1
                     freed_space += file_size
@@ -160,31 +294,23 @@ def _clean_cache():
                 
                 # Re-compress large files if we're still over the limit
                 if total_size > max_size_bytes * 0.9 and COMPRESSION_ENABLED:
-                    # Get uncompressed files or files compressed at lower levels
-                    for cache_type_dir in CACHE_DIR.iterdir():
-                        if not cache_type_dir.is_dir():
-                            continue
-                            
-                        for cache_file in cache_type_dir.iterdir():
-                            if not cache_file.is_file() or not cache_file.name.endswith('.cache.gz'):
-                                continue
+                    for cache_file, (mtime, _, cache_type) in list(_CACHE_INDEX.items()):
+                        # Try to recompress with higher compression level
+                        try:
+                            # Read the current compressed data
+                            data = read_cache_file(cache_file)
                                 
-                            # Try to recompress with higher compression level
-                            try:
-                                # Read the current compressed data
-                                with gzip.open(cache_file, 'rt', encoding='utf-8') as f:
-                                    data = json.load(f)
-                                    
-                                # Recompress with maximum compression level
-                                with gzip.open(cache_file, 'wt', encoding='utf-8', compresslevel=9) as f:
-                                    f.write(json.dumps(data))
-                                    
-                                logger.debug(f"Recompressed {cache_file} with max compression")
-                            except Exception as e:
-                                logger.warning(f"Failed to recompress {cache_file}: {e}")
+                            # Recompress with maximum compression level, keeping the age for the TTL
+                            write_cache_file(cache_file, data, max_compression=True)
+                            os.utime(cache_file, (mtime, mtime))
+                            _CACHE_INDEX[cache_file] = (mtime, cache_file.stat().st_size, cache_type)
+                                
+                            logger.debug(f"Recompressed {cache_file} with max compression")
+                        except Exception as e:
+                            logger.warning(f"Failed to recompress {cache_file}: {e}")
                     
                     # Calculate new size
-                    new_total_size = sum(f.stat().st_size for f in Path(CACHE_DIR).glob('**/*') if f.is_file())
+                    new_total_size = sum(size for _, size, _ in _CACHE_INDEX.values())
                     logger.info(f"After recompression: {new_total_size/(1024*1024):.2f} MB")
                 
         except Exception as e:
@@ -206,51 +332,39 @@ def _get_from_cache(cache_key: str, cache_type: str = "default", extended_ttl: b
     
     # First check in-memory cache (fastest)
     memory_key = f"{cache_type}:{normalized_key}"
-    if memory_key in MEMORY_CACHE:
-        cache_entry = MEMORY_CACHE[memory_key]
-        # Check if in-memory cache has expired
-        ttl = CACHE_TTL.get(cache_type, CACHE_TTL["default"])
-        # Use extended TTL if requested (for throttling)
-        if extended_ttl:
-            ttl *= 2  # Double the TTL for throttling
-            
-        if time.time() - cache_entry['timestamp'] <= ttl:
-            logger.debug(f"Memory cache hit for {cache_type}:{normalized_key}")
-            return cache_entry['data']
-        else:
-            # Remove expired entry
-            del MEMORY_CACHE[memory_key]
-            logger.debug(f"Memory cache expired for {cache_type}:{normalized_key}")
+    with _MEMORY_CACHE_LOCK:
+        cache_entry = MEMORY_CACHE.get(memory_key)
+        if cache_entry is not None:
+            # Check if in-memory cache has expired
+            ttl = CACHE_TTL.get(cache_type, CACHE_TTL["default"])
+            # Use extended TTL if requested (for throttling)
+            if extended_ttl:
+                ttl *= 2  # Double the TTL for throttling
+                
+            if time.time() - cache_entry['timestamp'] <= ttl:
+                logger.debug(f"Memory cache hit for {cache_type}:{normalized_key}")
+                MEMORY_CACHE.move_to_end(memory_key)
+                return cache_entry['data']
+            else:
+                # Remove expired entry
+                _pop_memory_entry(memory_key)
+                logger.debug(f"Memory cache expired for {cache_type}:{normalized_key}")
     
     # Check disk cache
     cache_path = _get_cache_path(cache_key, cache_type)
     
-    if not cache_path.exists():
-        return None
-    
-    # Check TTL based on cache type
+    # Check existence and TTL based on cache type (a single stat() call)
     if not _is_cache_valid(cache_path, cache_type, extended_ttl):
-        logger.debug(f"Disk cache expired for {cache_type}:{cache_key}")
+        logger.debug(f"Disk cache missing or expired for {cache_type}:{cache_key}")
         return None
     
     try:
-        # Read compressed data and decompress
-        with gzip.open(cache_path, 'rt', encoding='utf-8') as f:
-            cached_data = json.load(f)
-            
-            return None
+        # Read and decompress into bytes, parsed directly (no intermediate str)
+        raw = read_cache_file(cache_path)
+        cached_data = _json_loads(raw)
         
         # Update memory cache
-        MEMORY_CACHE[memory_key] = {
-            'timestamp': cached_data['timestamp'],
-            'data': cached_data['data']
-        }
-        
-        # Manage memory cache size
-        if len(MEMORY_CACHE) > MAX_MEMORY_CACHE_ITEMS:
-            # Remove oldest item (simplistic approach)
-            oldest_key = min(MEMORY_CACHE.keys(), key=lambda k: MEMORY_CACHE[k]['timestamp'])
-            del MEMORY_CACHE[oldest_key]
+        _put_in_memory_cache(memory_key, cached_data['timestamp'], cached_data['data'], len(raw))
             
         return cached_data['data']
     except Exception as e:
@@ -258,6 +372,46 @@ def _get_from_cache(cache_key: str, cache_type: str = "default", extended_ttl: b
         return None
 
 
+def _pop_memory_entry(memory_key: Optional[str] = None) -> None:
+    """Remove an entry (the least recently used if no key is given) from the in-memory cache.
+    
+    Must be called with _MEMORY_CACHE_LOCK held.
+    """
+    global _memory_cache_bytes
+    if memory_key is None:
+        _, entry = MEMORY_CACHE.popitem(last=False)
+    else:
+        entry = MEMORY_CACHE.pop(memory_key)
+    _memory_cache_bytes -= entry['size']
+
+
+def _put_in_memory_cache(memory_key: str, timestamp: float, data: Any, size: int) -> None:
+    """Insert an entry in the in-memory LRU cache, evicting the least recently used.
+    
+    Args:
+        memory_key: Key in the form "cache_type:normalized_key"
+        timestamp: Time the data was produced
+        data: The data to cache
+        size: Approximate footprint of the data in bytes (its serialized length)
+    """
+    global _memory_cache_bytes
+    with _MEMORY_CACHE_LOCK:
+        if memory_key in MEMORY_CACHE:
+            _pop_memory_entry(memory_key)
+        MEMORY_CACHE[memory_key] = {
+            'timestamp': timestamp,
+            'data': data,
+            'size': size
+        }
+        _memory_cache_bytes += size
+        
+        # Manage memory cache size: evict until both the item and the byte limits hold
+        # (the newest entry is always kept, even if it exceeds the byte budget alone)
+        while len(MEMORY_CACHE) > 1 and (len(MEMORY_CACHE) > MAX_MEMORY_CACHE_ITEMS
+                                         or _memory_cache_bytes > MAX_MEMORY_CACHE_BYTES):
+            _pop_memory_entry()
+
+
 def _is_cache_valid(cache_path: Path, cache_type: str, extended_ttl: bool = False) -> bool:
     """Check if a cache file is valid based on its age and type.
     
@@ -267,7 +421,7 @@ def _is_cache_valid(cache_path: Path, cache_type: str, extended_ttl: bool = Fals
         extended_ttl: If True, use a longer TTL for throttling scenarios
         
     Returns:
-        True if the cache is valid, False otherwise
+        True if the cache file exists and is valid, False otherwise
     """
     # Get the cache TTL based on type
     ttl = CACHE_TTL.get(cache_type, CACHE_TTL["default"])
@@ -277,7 +431,10 @@ def _is_cache_valid(cache_path: Path, cache_type: str, extended_ttl: bool = Fals
         ttl *= 2  # Double the TTL for throttling
     
     # Check the cache file's age
-    file_age = time.time() - cache_path.stat().st_mtime
+    try:
+        file_age = time.time() - cache_path.stat().st_mtime
+    except FileNotFoundError:
+        return False
     
     return file_age <= ttl
 
@@ -290,11 +447,8 @@ def _save_to_cache(cache_key: str, data: Any, cache_type: str = "default") -> bo
         cache_type: Type of cached data (affects storage location)
         
     Returns:
-        True if successfully cached, False otherwise
+        True if cached in memory and queued for the disk write, False otherwise
     """
-    # Occasionally clean the cache
-    _clean_cache()
-    
     # Skip caching if data is None
     if data is None:
         return False
@@ -302,22 +456,8 @@ def _save_to_cache(cache_key: str, data: Any, cache_type: str = "default") -> bo
     # Normalizza la chiave per consistenza
     normalized_key = cache_key_manager.normalize_key(cache_key)
     
-    # Update memory cache
     memory_key = f"{cache_type}:{normalized_key}"
     timestamp = time.time()
-    MEMORY_CACHE[memory_key] = {
-        'timestamp': timestamp,
-        'data': data
-    }
-    
-    # Manage memory cache size
-    if len(MEMORY_CACHE) > MAX_MEMORY_CACHE_ITEMS:
-        # Remove oldest item
-        oldest_key = min(MEMORY_CACHE.keys(), key=lambda k: MEMORY_CACHE[k]['timestamp'])
-        del MEMORY_CACHE[oldest_key]
-    
-    # Update disk cache
-    cache_path = _get_cache_path(cache_key, cache_type)
     
     try:
         # Prepare the data to be cached
@@ -326,25 +466,56 @@ def _save_to_cache(cache_key: str, data: Any, cache_type: str = "default") -> bo
             'data': data
         }
         
-        # Convert to JSON string first to determine size
-        json_data = json.dumps(cache_data)
-        data_size = len(json_data.encode('utf-8'))
-        
-        # Use compression for data over the threshold size
-        if COMPRESSION_ENABLED and data_size > COMPRESSION_THRESHOLD:
-            with gzip.open(cache_path, 'wt', encoding='utf-8', compresslevel=COMPRESSION_LEVEL) as f:
-                # We don't need indentation with compression to save space
-                f.write(json_data)
-                logger.debug(f"Compressed cache ({data_size} bytes) for {cache_type}:{normalized_key}")
-        else:
-            # For small data, we can use pretty printing for better readability if needed manually
-            with gzip.open(cache_path, 'wt', encoding='utf-8', compresslevel=COMPRESSION_LEVEL) as f:
-                json.dump(cache_data, f, indent=2)
-                
-        return True
+        # Serialize now, so later changes to data by the caller can't race with the writer
+        json_data = _json_dumps(cache_data)
     except Exception as e:
         logger.warning(f"Failed to write to cache: {e}")
+        json_data = None
+    
+    # Update memory cache (the serialized length doubles as the entry size)
+    _put_in_memory_cache(memory_key, timestamp, data, len(json_data) if json_data else 0)
+    if json_data is None:
         return False
+    
+    # Update disk cache
+    cache_path = _get_cache_path(cache_key, cache_type)
+    
+    _CACHE_WRITER.submit(_write_to_disk, cache_path, json_data, cache_type, normalized_key)
+    return True
+
+
+def _write_to_disk(cache_path: Path, json_data: bytes, cache_type: str, normalized_key: str) -> None:
+    """Write a serialized cache entry to disk (runs on the cache writer thread).
+    
+    Args:
+        cache_path: Destination cache file
+        json_data: Serialized entry
+        cache_type: Type of cached data (affects TTL on cleanup)
+        normalized_key: Entry key, for log messages
+    """
+    # Index the files already on disk on the first write, then occasionally clean the cache
+    if not _cache_index_loaded:
+        try:
+            _load_cache_index()
+        except OSError as e:
+            logger.warning(f"Failed to index cache files: {e}")
+    _clean_cache()
+    
+    try:
+        # Small payloads are written raw since compressing them costs more than it saves
+        compress = COMPRESSION_ENABLED and len(json_data) > COMPRESSION_THRESHOLD
+        write_cache_file(cache_path, json_data, gzip_level=COMPRESSION_LEVEL, compress=compress)
+        st = cache_path.stat()
+        _CACHE_INDEX[cache_path] = (st.st_mtime, st.st_size, cache_type)
+        logger.debug(f"Cached {len(json_data)} bytes for {cache_type}:{normalized_key} (compressed: {compress})")
+    except Exception as e:
+        logger.warning(f"Failed to write to cache: {e}")
+
+
+def flush_cache_writes() -> None:
+    """Wait until all queued cache writes have reached the disk."""
+    # The writer has a single thread, so a no-op job completes after everything queued before it
+    _CACHE_WRITER.submit(lambda: None).result()
 
 
 def deepseek_chat(messages: List[Dict], model: str = None, temperature: float = 0.7, 
@@ -364,15 +535,13 @@ def deepseek_chat(messages: List[Dict], model: str = None, temperature: float =
         market: Symbol of the market this request is related to, if applicable
         
     Returns:
-        str: Response from the DeepSeek API
+        str: Response from the DeepSeek API (a FallbackResponse when no answer was obtained)
     """
-    request_type = cache_type  # Usiamo il tipo di cache come tipo di richiesta
-    
     if offline:
-        return "DeepSeek API is in offline mode. This is a fallback response."
+        return FallbackResponse("DeepSeek API is in offline mode. This is a fallback response.")
         
     if not API_KEY:
-        return "DeepSeek API key not configured. Set the DEEPSEEK_API_KEY environment variable."
+        return FallbackResponse("DeepSeek API key not configured. Set the DEEPSEEK_API_KEY environment variable.")
     
     # Normalize model name
     if not model:
@@ -386,7 +555,7 @@ def deepseek_chat(messages: List[Dict], model: str = None, temperature: float =
                         for k, v in msg.items()}
         sanitized_messages.append(sanitized_msg)
     
-    cache_key = str(hash(str(sanitized_messages) + str(model) + str(temperature) + str(max_tokens)))
+    cache_key = _stable_key(sanitized_messages, model, temperature, max_tokens)
     
     # Check cache first
     cached_response = _get_from_cache(cache_key, cache_type)
@@ -394,40 +563,106 @@ def deepseek_chat(messages: List[Dict], model: str = None, temperature: float =
         logger.info(f"Using cached DeepSeek response for {cache_type}")
         return cached_response
     
+    # A recent throttled request gets the same fallback without re-entering the throttling checks
+    throttled_key = f"throttled:{cache_type}:{cache_key}"
+    throttled_response = _get_throttled_fallback(throttled_key)
+    if throttled_response is not None:
+        return throttled_response
+    
+    # Single flight: the first caller makes the request, identical concurrent calls share its result
+    with _INFLIGHT_LOCK:
+        flight = _INFLIGHT.get(cache_key)
+        leader = flight is None
+        if leader:
+            flight = _INFLIGHT[cache_key] = _Flight()
+    
+    if not leader:
+        logger.debug(f"Waiting for in-flight DeepSeek request for {cache_type}")
+        flight.event.wait()
+        return flight.result
+    
+    try:
+        flight.result = _chat_request(messages, model, temperature, max_tokens, cache_type, cache_key,
+                                      throttled_key, market)
+    finally:
+        with _INFLIGHT_LOCK:
+            del _INFLIGHT[cache_key]
+        flight.event.set()
+    return flight.result
+
+
+class _Flight:
+    """A DeepSeek request in progress, whose result concurrent identical requests wait for."""
+    __slots__ = ("event", "result")
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = FallbackResponse("Sorry, unavailable. An error occurred while connecting to the API.")
+
+
+def _get_throttled_fallback(throttled_key: str) -> Optional[Any]:
+    """Return the fallback recorded for a throttled request, if still within its TTL."""
+    with _MEMORY_CACHE_LOCK:
+        entry = MEMORY_CACHE.get(throttled_key)
+        if entry is not None and time.time() - entry['timestamp'] <= CACHE_TTL["throttled"]:
+            return entry['data']
+    return None
+
+
+def _chat_request(messages: List[Dict], model: str, temperature: float, max_tokens: int,
+                  cache_type: str, cache_key: str, throttled_key: str, market: Optional[str]) -> str:
+    """Call the DeepSeek API for a request not in cache, applying the throttling rules.
+    
+    Args:
+        messages: List of message dictionaries in OpenAI format
+        model: Model name to use
+        temperature: Temperature parameter for generation
+        max_tokens: Maximum tokens to generate
+        cache_type: Type of cache to use (also the request type for throttling)
+        cache_key: Cache key of the request
+        throttled_key: Memory cache key for the fallback response if throttled
+        market: Symbol of the market this request is related to, if applicable
+        
+    Returns:
+        str: Response from the DeepSeek API, or a fallback response
+    """
+    request_type = cache_type  # Usiamo il tipo di cache come tipo di richiesta
+    
     # Verifica se la richiesta dovrebbe essere eseguita in base alle regole di throttling
     if not usage_tracker.should_execute_api_call(request_type, market):
         logger.warning(f"Throttling: Skipping API call for {request_type}" + 
                       (f" on {market}" if market else ""))
         
-        # Se è una richiesta di tipo 'chat', genera una risposta personalizzata
+        # Per tipi diversi da 'chat' usa una cache più lunga se possibile
+        if cache_type != "chat":
+            extended_cached_response = _get_from_cache(cache_key, cache_type, extended_ttl=True)
+            if extended_cached_response:
+                logger.info(f"Throttling: Using extended cache for {cache_type}")
+                return extended_cached_response
+        
+        # Se è una richiesta di tipo 'chat', genera una risposta personalizzata,
+        # altrimenti ritorna una risposta neutra appropriata per il tipo
         if cache_type == "chat":
             throttling_level = usage_tracker.get_throttling_level()
             usage_report = usage_tracker.get_usage_report()
             daily_cost = usage_report["daily"]["estimated_cost"]
             percent = usage_report["daily"]["percent_of_limit"]
             
-            return (f"I'm currently operating in '{throttling_level}' throttling mode to control API costs. "
-                   f"Daily usage is ${daily_cost:.2f} ({percent:.1f}% of limit). "
-                   f"For non-critical queries, please try again later.")
-        
-        # Per altri tipi di richiesta, usa semplicemente una cache più lunga se possibile
-        # o ritorna una risposta neutra appropriata per il tipo
-        extended_cached_response = _get_from_cache(cache_key, cache_type, extended_ttl=True)
-        if extended_cached_response:
-            logger.info(f"Throttling: Using extended cache for {cache_type}")
-            return extended_cached_response
-            
-        if cache_type == "news_bias":
-            return ("neutral", 0.5)  # Valore neutro per news_bias
+            fallback = FallbackResponse(
+                f"I'm currently operating in '{throttling_level}' throttling mode to control API costs. "
+                f"Daily usage is ${daily_cost:.2f} ({percent:.1f}% of limit). "
+                f"For non-critical queries, please try again later.")
+        elif cache_type == "news_bias":
+            fallback = ("neutral", 0.5)  # Valore neutro per news_bias
+        else:
+            fallback = FallbackResponse("API request throttled to control costs. Using fallback response.")
         
-        return "API request throttled to control costs. Using fallback response."
+        # Ricorda il fallback per poco tempo (solo in memoria): le richieste ripetute non
+        # rientrano nei controlli di throttling
+        _put_in_memory_cache(throttled_key, time.time(), fallback, 0)
+        return fallback
     
     try:
-        headers = {
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
         data = {
             "model": model or MODEL,
             "messages": messages,
@@ -435,16 +670,15 @@ def deepseek_chat(messages: List[Dict], model: str = None, temperature: float =
             "max_tokens": max_tokens
         }
         
-        response = requests.post(
+        response = DEEPSEEK_SESSION.post(
             f"{API_BASE}/chat/completions",
-            headers=headers,
             json=data,
             timeout=30
         )
         
         if response.status_code != 200:
             logger.error(f"DeepSeek API error: {response.status_code} - {response.text}")
-            return f"Sorry, unavailable. API error: {response.status_code}"
+            return FallbackResponse(f"Sorry, unavailable. API error: {response.status_code}")
             
         result = response.json()
         content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
@@ -459,13 +693,13 @@ def deepseek_chat(messages: List[Dict], model: str = None, temperature: float =
         usage_tracker.track_api_call(request_type, total_tokens, market)
         
         # Cache the successful response
-        _save_to_cache(cache_key, content)
+        _save_to_cache(cache_key, content, cache_type)
         
         return content
         
     except Exception as e:
         logger.error(f"Error calling DeepSeek API: {e}")
-        return "Sorry, unavailable. An error occurred while connecting to the API."
+        return FallbackResponse("Sorry, unavailable. An error occurred while connecting to the API.")
 
 
 def news_bias(symbol: str, headlines: List[str], offline: bool = False) -> Tuple[str, float]:
@@ -569,16 +803,21 @@ def qa(question: str, context: Dict, offline: bool = False) -> str:
             positions: broker_state_dict
             cot: cot_dataframe.tail(4).to_dict()
             news: headlines_list
+            _version: optional counter that changes whenever the data above changes
         offline: If True, return a fallback response without making an API call
             
     Returns:
         str: Answer to the question based on the provided context
     """
     if offline:
-        return f"Offline mode: I would analyze {len(context.keys())} context elements to answer: '{question}'"
+        return FallbackResponse(f"Offline mode: I would analyze {len(context.keys())} context elements to answer: '{question}'")
     
-    # Create cache key
-    cache_key = f"qa_{hash(question[:100])}_{hash(str(context)[:100])}"
+    # Create cache key: a versioned context only needs its history hashed
+    if "_version" in context:
+        context_key = (context["_version"], context.get("conversation_history", ""))
+    else:
+        context_key = str(context)
+    cache_key = f"qa_{_stable_key(question, context_key)}"
     
     # Check cache
     cached_result = _get_from_cache(cache_key, "chat")
@@ -587,25 +826,26 @@ def qa(question: str, context: Dict, offline: bool = False) -> str:
         return cached_result
     
     try:
-        # Format the context as a string
-        context_str = ""
+        # Format the context as a string (parts joined once at the end)
+        context_parts = []
         
         if "signals" in context and context["signals"]:
-            context_str += "\nLatest Trading Signals:\n"
-            context_str += json.dumps(context["signals"], indent=2)
+            context_parts.append("\nLatest Trading Signals:\n")
+            context_parts.append(json.dumps(context["signals"], indent=2))
         
         if "positions" in context and context["positions"]:
-            context_str += "\nCurrent Positions:\n"
-            context_str += json.dumps(context["positions"], indent=2)
+            context_parts.append("\nCurrent Positions:\n")
+            context_parts.append(json.dumps(context["positions"], indent=2))
         
         if "cot" in context and context["cot"]:
-            context_str += "\nLatest COT Data:\n"
-            context_str += str(context["cot"])
+            context_parts.append("\nLatest COT Data:\n")
+            context_parts.append(str(context["cot"]))
         
         if "news" in context and context["news"]:
-            context_str += "\nRecent News Headlines:\n"
-            for headline in context["news"]:
-                context_str += f"- {headline}\n"
+            context_parts.append("\nRecent News Headlines:\n")
+            context_parts.extend(f"- {headline}\n" for headline in context["news"])
+        
+        context_str = "".join(context_parts)
         
         prompt = f"""
         Based on the following trading context, please answer this question:
@@ -625,14 +865,15 @@ def qa(question: str, context: Dict, offline: bool = False) -> str:
         
         response = deepseek_chat(messages, temperature=0.3, max_tokens=500)
         
-        # Cache the response
-        _save_to_cache(cache_key, response, "chat")
+        # Cache the response (fallbacks are retried on the next call instead)
+        if not isinstance(response, FallbackResponse):
+            _save_to_cache(cache_key, response, "chat")
         
         return response
         
     except Exception as e:
         logger.error(f"Error in qa: {e}")
-        return f"Sorry, I couldn't answer your question due to an error: {str(e)}"
+        return FallbackResponse(f"Sorry, I couldn't answer your question due to an error: {str(e)}")
 
 
 def fetch_commodity_news(symbol: str, days: int = 3) -> List[str]:
@@ -646,19 +887,7 @@ def fetch_commodity_news(symbol: str, days: int = 3) -> List[str]:
     Returns:
         List of news headlines
     """
-    # Define symbol to keyword mapping
-    symbol_keywords = {
-        "XAUUSD": "gold OR \"precious metals\"",
-        "XAGUSD": "silver OR \"precious metals\"",
-        "WTICOUSD": "WTI OR crude OR oil",
-        "BCOUSD": "brent OR crude OR oil",
-        "NATGASUSD": "natural gas",
-        "CORNUSD": "corn OR grain",
-        "SOYBNUSD": "soybean OR grain",
-        "WHEATUSD": "wheat OR grain"
-    }
-    
-    if symbol not in symbol_keywords:
+    if symbol not in NEWS_KEYWORDS:
         return [f"No keyword mapping for {symbol}"]
     
     # Check cache first
@@ -678,16 +907,16 @@ def fetch_commodity_news(symbol: str, days: int = 3) -> List[str]:
         
         # Make API request
         params = {
-            "q": symbol_keywords[symbol],
+            "q": NEWS_KEYWORDS[symbol],
             "from": from_date,
             "to": to_date,
             "language": "en",
             "sortBy": "relevancy",
-            "pageSize": 15,
+            "pageSize": NEWS_PAGE_SIZE,
             "apiKey": NEWS_API_KEY
         }
         
-        response = requests.get(NEWS_API_BASE, params=params)
+        response = NEWS_SESSION.get(NEWS_API_BASE, params=params)
         data = response.json()
         
         if response.status_code != 200:
@@ -707,6 +936,90 @@ def fetch_commodity_news(symbol: str, days: int = 3) -> List[str]:
         return [f"Error fetching news: {str(e)}"]
 
 
+def fetch_commodity_news_batch(symbols: List[str], days: int = 3) -> Dict[str, List[str]]:
+    """
+    Fetch recent news headlines for several commodities with a single NewsAPI request.
+    
+    The keyword queries of the symbols not in cache are OR-joined into one query and each
+    article is assigned locally to the symbols whose keywords it mentions. Results are
+    cached per symbol, so fetch_commodity_news benefits from them too.
+    
+    Args:
+        symbols: Trading symbols (e.g., ['XAUUSD', 'WTICOUSD'])
+        days: Number of days of news to retrieve
+        
+    Returns:
+        Dict mapping each symbol to its list of news headlines
+    """
+    results = {}
+    missing = []
+    for symbol in symbols:
+        if symbol not in NEWS_KEYWORDS:
+            results[symbol] = [f"No keyword mapping for {symbol}"]
+            continue
+        cached_news = _get_from_cache(f"news_{symbol}_{days}", "news")
+        if cached_news:
+            results[symbol] = cached_news
+        else:
+            missing.append(symbol)
+    
+    # Nothing to batch: use the per-symbol query (more precise ranking for one symbol)
+    if len(missing) <= 1:
+        for symbol in missing:
+            results[symbol] = fetch_commodity_news(symbol, days)
+        return results
+    
+    # Union of the search terms of the missing symbols for the query (order preserved)
+    query_terms = dict.fromkeys(term for symbol in missing for term in NEWS_KEYWORDS[symbol].split(" OR "))
+    
+    try:
+        # Calculate date range
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days)
+        
+        params = {
+            "q": " OR ".join(query_terms),
+            "from": start_date.strftime("%Y-%m-%d"),
+            "to": end_date.strftime("%Y-%m-%d"),
+            "language": "en",
+            "sortBy": "relevancy",
+            "pageSize": NEWS_BATCH_PAGE_SIZE,
+            "apiKey": NEWS_API_KEY
+        }
+        
+        response = NEWS_SESSION.get(NEWS_API_BASE, params=params)
+        data = response.json()
+        
+        if response.status_code != 200:
+            logger.error(f"News API error: {data}")
+            error = [f"Error fetching news: {data.get('message', 'Unknown error')}"]
+            results.update((symbol, error) for symbol in missing)
+            return results
+        
+        # Assign each article to the symbols whose keywords appear in its title or description
+        headlines = {symbol: [] for symbol in missing}
+        for article in data.get("articles", []):
+            title = article.get("title")
+            if not title:
+                continue
+            text = f"{title} {article.get('description') or ''}"
+            for symbol, symbol_headlines in headlines.items():
+                if len(symbol_headlines) < NEWS_PAGE_SIZE and NEWS_KEYWORD_PATTERNS[symbol].search(text):
+                    symbol_headlines.append(title)
+        
+        # Cache each symbol with news-specific TTL
+        for symbol, symbol_headlines in headlines.items():
+            _save_to_cache(f"news_{symbol}_{days}", symbol_headlines, "news")
+        results.update(headlines)
+        
+        return results
+        
+    except Exception as e:
+        logger.error(f"Error fetching news: {e}")
+        results.update((symbol, [f"Error fetching news: {str(e)}"]) for symbol in missing)
+        return results
+
+
 def pattern_recognition(ohlc_data: pd.DataFrame, symbol: str, offline: bool = False) -> Dict:
     """
     Use DeepSeek to identify technical patterns in price data.
@@ -741,24 +1054,27 @@ def pattern_recognition(ohlc_data: pd.DataFrame, symbol: str, offline: bool = Fa
         return cached_result
     
     try:
-        # Format recent price data as text
-        price_text = ""
-        for _, row in recent_data.iterrows():
-            date_str = row.name.strftime("%Y-%m-%d") if hasattr(row.name, 'strftime') else str(row.name)
-            price_text += f"{date_str}: Open={row['open']:.2f}, High={row['high']:.2f}, Low={row['low']:.2f}, Close={row['close']:.2f}\n"
+        # Format recent price data as text (one pass over plain arrays, no per-row Series)
+        if isinstance(recent_data.index, pd.DatetimeIndex):
+            dates = recent_data.index.strftime("%Y-%m-%d")
+        else:
+            dates = recent_data.index.map(str)
+        rows = recent_data[['open', 'high', 'low', 'close']].to_numpy(dtype=np.float64)
+        price_text = "".join(
+            f"{date_str}: Open={o:.2f}, High={h:.2f}, Low={l:.2f}, Close={c:.2f}\n"
+            for date_str, (o, h, l, c) in zip(dates, rows)
+        )
         
-        # Calculate some basic indicators
-        recent_data['sma_20'] = ohlc_data['close'].rolling(20).mean().tail(20)
-        recent_data['sma_50'] = ohlc_data['close'].rolling(50).mean().tail(20)
-        recent_data['rsi'] = calculate_rsi(ohlc_data['close'], 14).tail(20)
+        # Calculate some basic indicators (only the latest values go in the prompt,
+        # so they are computed from the last closes instead of the whole series)
+        close = ohlc_data['close'].to_numpy(dtype=np.float64)[-50:]
         
         # Add indicators to text
         indicators_text = ""
-        latest = recent_data.iloc[-1]
         indicators_text += f"Latest indicators:\n"
-        indicators_text += f"SMA20: {latest['sma_20']:.2f}\n"
-        indicators_text += f"SMA50: {latest['sma_50']:.2f}\n"
-        indicators_text += f"RSI(14): {latest['rsi']:.2f}\n"
+        indicators_text += f"SMA20: {_last_sma(close, 20):.2f}\n"
+        indicators_text += f"SMA50: {_last_sma(close, 50):.2f}\n"
+        indicators_text += f"RSI(14): {_last_rsi(close, 14):.2f}\n"
         
         prompt = f"""
         Analyze the recent price action for {symbol} and identify any significant technical patterns.
@@ -851,8 +1167,7 @@ def portfolio_optimization(positions: List[Dict], risk_profile: str = "moderate"
         }
     
     # Cache key for this optimization
-    positions_hash = hash(str(positions)[:200])  # Limit size for hash
-    cache_key = f"portfolio_opt_{positions_hash}_{risk_profile}"
+    cache_key = f"portfolio_opt_{_stable_key(positions)}_{risk_profile}"
     
     # Check cache with portfolio-specific TTL
     cached_result = _get_from_cache(cache_key, "portfolio")
@@ -960,9 +1275,7 @@ def scenario_analysis(portfolio: Dict, scenarios: List[str] = None, offline: boo
         }
     
     # Cache key for this analysis
-    portfolio_hash = hash(str(portfolio)[:200])  # Limit size for hash
-    scenarios_hash = hash(str(scenarios)[:100])
-    cache_key = f"scenario_{portfolio_hash}_{scenarios_hash}"
+    cache_key = f"scenario_{_stable_key(portfolio, scenarios)}"
     
     # Check cache with scenario-specific TTL
     cached_result = _get_from_cache(cache_key, "scenario")
@@ -1046,15 +1359,23 @@ def scenario_analysis(portfolio: Dict, scenarios: List[str] = None, offline: boo
         }
 
 
-def calculate_rsi(series, period=14):
-    """Calculate the Relative Strength Index (RSI) for a price series."""
-    delta = series.diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-    
-    rs = gain / loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
+def _last_sma(values: np.ndarray, window: int) -> float:
+    """Latest simple moving average, same as rolling(window).mean().iloc[-1] (NaN if too short)."""
+    if len(values) < window:
+        return np.nan
+    return values[-window:].mean()
+
+
+def _last_rsi(values: np.ndarray, period: int = 14) -> float:
+    """Latest RSI with simple averages of gains and losses, computed from the last period+1 values only."""
+    if len(values) <= period:
+        return np.nan
+    delta = np.diff(values[-(period + 1):])
+    gain = np.where(delta > 0, delta, 0.0).mean()
+    loss = np.where(delta < 0, -delta, 0.0).mean()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = gain / loss
+        return 100 - (100 / (1 + rs))
 
 
 def get_cache_stats():
@@ -1066,6 +1387,8 @@ def get_cache_stats():
     stats = {
         "memory_items": len(MEMORY_CACHE),
         "memory_limit": MAX_MEMORY_CACHE_ITEMS,
+        "memory_bytes": _memory_cache_bytes,
+        "memory_bytes_limit": MAX_MEMORY_CACHE_BYTES,
         "disk_usage_mb": 0,
         "disk_limit_mb": MAX_DISK_CACHE_SIZE_MB,
         "compression_enabled": COMPRESSION_ENABLED,
@@ -1131,6 +1454,7 @@ def self_test():
     
     # Retrieve from cache
     retrieved_data = _get_from_cache(cache_key, "test")
+    flush_cache_writes()  # The size check below needs the file on disk
     
     if retrieved_data:
         cache_path = _get_cache_path(cache_key, "test")
@@ -1173,7 +1497,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="DeepSeek Utils for OpenMT4TradingBot")
     parser.add_argument("--selftest", action="store_true", help="Run self-test")
     parser.add_argument("--offline", action="store_true", help="Run in offline mode")
-    parser.add_argument("--news", type=str, help="Fetch news for symbol (e.g., XAUUSD)")
+    parser.add_argument("--news", type=str, help="Fetch news for symbols (e.g., XAUUSD or XAUUSD,WTICOUSD)")
     parser.add_argument("--analyze", type=str, help="Run market analysis for symbol")
     parser.add_argument("--compress", type=int, choices=range(0, 10), default=COMPRESSION_LEVEL, 
                       help="Set compression level (0-9, where 9 is max compression)")
@@ -1204,9 +1528,12 @@ if __name__ == "__main__":
     
     if args.news:
         print(f"Fetching news for {args.news}...")
-        headlines = fetch_commodity_news(args.news, days=5)
-        for headline in headlines:
-            print(f"- {headline}")
+        symbols = [symbol.strip() for symbol in args.news.split(",") if symbol.strip()]
+        for symbol, headlines in fetch_commodity_news_batch(symbols, days=5).items():
+            if len(symbols) > 1:
+                print(f"\n{symbol}:")
+            for headline in headlines:
+                print(f"- {headline}")
     
     elif args.analyze:
         print(f"Analyzing {args.analyze}...")
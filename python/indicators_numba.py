@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Indicatori tecnici compilati con Numba per OpenMT4TradingBot.
+
+Questo modulo raccoglie i kernel numerici usati sui percorsi caldi dell'API
+(grafici, segnali). Se Numba non è installato le funzioni restano utilizzabili
+come normale codice Python.
+
+MIT License
+
+Copyright (c) 2025 Immaginet Srl
+"""
+
+import numpy as np
+
+# Try importing Numba for JIT compilation
+try:
+    from numba import njit
+
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """Decoratore di ripiego: restituisce la funzione invariata."""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+
+@njit(cache=True)
+def donchian(high, low, period):
+    """Calcola il canale di Donchian in O(N) con due deque monotone.
+
+    Args:
+        high: Array float64 dei massimi
+        low: Array float64 dei minimi
+        period: Ampiezza della finestra
+
+    Returns:
+        Tupla (upper, lower) di array float64, con NaN per i primi period-1 campioni
+        e finché la finestra contiene un NaN (come rolling().max()/min() di pandas)
+    """
+    n = high.shape[0]
+    upper = np.full(n, np.nan)
+    lower = np.full(n, np.nan)
+
+    # Deque circolari di indici: al massimo `period` elementi per finestra
+    max_idx = np.empty(period, dtype=np.int64)
+    min_idx = np.empty(period, dtype=np.int64)
+    max_head = 0
+    max_len = 0
+    min_head = 0
+    min_len = 0
+    # Ultimo indice NaN visto: i NaN non entrano nelle deque, ma azzerano la finestra
+    max_nan = -period
+    min_nan = -period
+
+    for i in range(n):
+        # Rimuovi l'indice uscito dalla finestra
+        if max_len > 0 and max_idx[max_head] <= i - period:
+            max_head = (max_head + 1) % period
+            max_len -= 1
+        if min_len > 0 and min_idx[min_head] <= i - period:
+            min_head = (min_head + 1) % period
+            min_len -= 1
+
+        # Mantieni la deque dei massimi decrescente
+        if np.isnan(high[i]):
+            max_nan = i
+        else:
+            while max_len > 0 and high[max_idx[(max_head + max_len - 1) % period]] <= high[i]:
+                max_len -= 1
+            max_idx[(max_head + max_len) % period] = i
+            max_len += 1
+
+        # Mantieni la deque dei minimi crescente
+        if np.isnan(low[i]):
+            min_nan = i
+        else:
+            while min_len > 0 and low[min_idx[(min_head + min_len - 1) % period]] >= low[i]:
+                min_len -= 1
+            min_idx[(min_head + min_len) % period] = i
+            min_len += 1
+
+        if i >= period - 1:
+            if i - max_nan >= period:
+                upper[i] = high[max_idx[max_head]]
+            if i - min_nan >= period:
+                lower[i] = low[min_idx[min_head]]
+
+    return upper, lower
+
+
+@njit(cache=True)
+def nearest_index(values, target):
+    """Restituisce l'indice del valore più vicino a target (-1 se l'array è vuoto).
+
+    Args:
+        values: Array float64 in cui cercare (i NaN vengono ignorati)
+        target: Valore di riferimento
+
+    Returns:
+        Indice dell'elemento più vicino
+    """
+    best_idx = -1
+    best_dist = np.inf
+    for i in range(values.shape[0]):
+        dist = abs(values[i] - target)
+        if dist < best_dist:
+            best_dist = dist
+            best_idx = i
+    return best_idx
+
+
+def warmup():
+    """Compila (o carica dalla cache su disco) i kernel con input minimi."""
+    dummy = np.zeros(2, dtype=np.float64)
+    donchian(dummy, dummy, 2)
+    nearest_index(dummy, 0.0)
+
+
+def donchian_matches_pandas(period=3):
+    """Confronta donchian con il ripiego pandas su una serie con buchi di NaN.
+
+    Args:
+        period: Ampiezza della finestra usata nel confronto
+
+    Returns:
+        True se i due calcoli coincidono (NaN compresi)
+    """
+    import pandas as pd
+
+    high = np.array([5.0, 7.0, np.nan, 6.0, 4.0, 8.0, 3.0, np.nan, np.nan, 9.0, 2.0, 6.0, 1.0, 5.0])
+    low = high - 1.0
+    low[4] = np.nan
+    upper, lower = donchian(high, low, period)
+    expected_upper = pd.Series(high).rolling(window=period).max().to_numpy()
+    expected_lower = pd.Series(low).rolling(window=period).min().to_numpy()
+    return (np.array_equal(upper, expected_upper, equal_nan=True)
+            and np.array_equal(lower, expected_lower, equal_nan=True))
@@ -49,17 +49,20 @@ const TradingChart = ({ symbol }) => {
       return <div className="chart-error">Errore: {error}</div>;
     }
     
-    if (!chartData || !chartData.ohlc || chartData.ohlc.length === 0) {
+    if (!chartData || !chartData.dates || chartData.dates.length === 0) {
       return <div className="chart-no-data">Nessun dato disponibile per {symbol}</div>;
     }
 
+    // Le date arrivano come millisecondi epoch
+    const dates = chartData.dates.map(ms => new Date(ms));
+
     // Configurazione del grafico OHLC principale
     const candlestickTrace = {
-      x: chartData.dates,
-      open: chartData.ohlc.map(d => d.open),
-      high: chartData.ohlc.map(d => d.high),
-      low: chartData.ohlc.map(d => d.low),
-      close: chartData.ohlc.map(d => d.close),
+      x: dates,
+      open: chartData.ohlc.open,
+      high: chartData.ohlc.high,
+      low: chartData.ohlc.low,
+      close: chartData.ohlc.close,
       type: 'candlestick',
       name: symbol,
       increasing: {line: {color: '#26a69a'}},
@@ -72,7 +75,7 @@ const TradingChart = ({ symbol }) => {
     // Aggiungi indicatori in base alla selezione
     if (indicator === 'donchian' && chartData.donchian) {
       traces.push({
-        x: chartData.dates,
+        x: dates,
         y: chartData.donchian.upper,
         type: 'scatter',
         mode: 'lines',
@@ -81,7 +84,7 @@ const TradingChart = ({ symbol }) => {
       });
       
       traces.push({
-        x: chartData.dates,
+        x: dates,
         y: chartData.donchian.lower,
         type: 'scatter',
         mode: 'lines',
@@ -97,7 +100,7 @@ const TradingChart = ({ symbol }) => {
       const buySignals = chartData.signals
         .filter(s => s.type === 'buy')
         .map(s => ({
-          x: [s.date],
+          x: [new Date(s.date)],
           y: [s.price],
           type: 'scatter',
           mode: 'markers',
@@ -112,7 +115,7 @@ const TradingChart = ({ symbol }) => {
       const sellSignals = chartData.signals
         .filter(s => s.type === 'sell')
         .map(s => ({
-          x: [s.date],
+          x: [new Date(s.date)],
           y: [s.price],
           type: 'scatter',
           mode: 'markers',